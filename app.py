@@ -6,7 +6,7 @@ AfiyetAI Web Arayüzü - Fiş Yükleme ve Tarif Önerisi
 import os
 import logging
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_from_directory
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -20,11 +20,13 @@ from dotenv import load_dotenv
 load_dotenv()
 from functools import wraps
 import time
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import text
 
 from receipt_ingest import process_receipt_image
-from recipe_recommender import RecipeRecommender
+from recipe_recommender import RecipeRecommender, invalidate_user_preferences
 import translate_utils
 
 def generate_mock_recipes_from_receipt(ingredients):
@@ -85,6 +87,51 @@ def generate_mock_recipes_from_receipt(ingredients):
     
     return mock_recipes[:5]
 
+# Tarif önerisi istek iş parçacığının yanında paralel yürütülür (envanter yazımıyla çakıştırmak için)
+_RECOMMEND_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="recommend")
+
+def recommend_for_receipt(recommender, user_id, extracted_ingredients, inventory_ready=None):
+    """Fiş ürünlerinden tarif öner; sonuç yoksa/hata olursa kullanıcı envanterine düş.
+
+    inventory_ready verilirse envanter yedeği bu olay set edilene (fiş ürünleri yazılana) kadar bekler.
+    """
+    def recommend_from_inventory():
+        # Envanter sorgusu, bu fişin ürünleri commit edilmeden çalışmasın
+        if inventory_ready is not None:
+            inventory_ready.wait()
+        return recommender.recommend_recipes(user_id=user_id, max_recipes=5)
+
+    # Eğer fişte ürün bulunamadıysa normal user inventory kullan
+    if not extracted_ingredients:
+        logger.info("❌ Fişte ürün bulunamadı, inventory kullanılıyor")
+        recommendations = recommend_from_inventory()
+    else:
+        # Fiş ürünlerini kullanarak tarif ara
+        logger.info(f"🍽️ Fiş ürünleriyle tarif aranıyor: {extracted_ingredients[:5]}")
+        try:
+            recommendations = recommender.recommend_recipes_from_receipt(extracted_ingredients[:5], max_recipes=5, user_id=user_id)
+            logger.info(f"✅ Fiş ürünleriyle {len(recommendations)} tarif bulundu")
+            if not recommendations:
+                logger.info("❌ Spoonacular API problemi - Kullanıcı envanterinden tarif aranıyor")
+                # Kullanıcının mevcut envanterinden tarif öner
+                try:
+                    recommendations = recommend_from_inventory()
+                    logger.info(f"✅ Envanterden {len(recommendations)} tarif bulundu")
+                except Exception as e:
+                    logger.error(f"❌ Envanter tarif arama hatası: {e}")
+                    recommendations = []
+        except Exception as e:
+            logger.error(f"❌ Fiş ürünleriyle tarif arama hatası: {e}")
+            logger.info("🔧 Kullanıcı envanterinden tarif aranıyor")
+            # Kullanıcının mevcut envanterinden tarif öner
+            try:
+                recommendations = recommend_from_inventory()
+                logger.info(f"✅ Envanterden {len(recommendations)} tarif bulundu")
+            except Exception as e2:
+                logger.error(f"❌ Envanter tarif arama hatası: {e2}")
+                recommendations = []
+    return recommendations
+
 # ======== Normalize isim seçici yardımcılar (EKLENDİ) ========
 def pick_tr_name(p: dict) -> str:
     return (
@@ -191,6 +238,24 @@ def init_db():
             ON user_inventory(expiry_date)
         ''')
         
+        # Metin çevirileri (translate_utils kalıcı önbelleği: tarif başlıkları, malzeme/ürün adları)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS text_translations (
+                source_text TEXT NOT NULL,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (source_text, source_lang, target_lang)
+            )
+        ''')
+        
+        # Tarif önerisi envanter sorgusu (kullanıcı filtresi + SKT sıralaması + LIMIT) tek indeksten
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_inventory_user_expiry 
+            ON user_inventory(user_id, expiry_date)
+        ''')
+        
         conn.commit()
         cursor.close()
         conn.close()
@@ -267,7 +332,6 @@ def add_products_to_inventory(user_id, products, receipt_id=None):
             shelf_life_days = product.get('shelf_life_days', 7)
             
             # Raf ömrü hesapla
-            from datetime import datetime, timedelta
             purchase_date = datetime.now()
             expiry_date = purchase_date + timedelta(days=shelf_life_days)
             
@@ -676,7 +740,6 @@ def dashboard():
     receipt_count = get_user_receipt_count(user_id)
     
     # Şu anki tarih
-    from datetime import datetime
     now = datetime.now()
     
     
@@ -771,35 +834,12 @@ def upload_file():
                 
                 logger.info(f"🔍 Fişten çıkarılan ürünler: {extracted_ingredients}")
                 
-                # Eğer fişte ürün bulunamadıysa normal user inventory kullan
-                if not extracted_ingredients:
-                    logger.info("❌ Fişte ürün bulunamadı, inventory kullanılıyor")
-                    recommendations = recommender.recommend_recipes(user_id=user_id, max_recipes=5)
-                else:
-                    # Fiş ürünlerini kullanarak tarif ara
-                    logger.info(f"🍽️ Fiş ürünleriyle tarif aranıyor: {extracted_ingredients[:5]}")
-                    try:
-                        recommendations = recommender.recommend_recipes_from_receipt(extracted_ingredients[:5], max_recipes=5, user_id=user_id)
-                        logger.info(f"✅ Fiş ürünleriyle {len(recommendations)} tarif bulundu")
-                        if not recommendations:
-                            logger.info("❌ Spoonacular API problemi - Kullanıcı envanterinden tarif aranıyor")
-                            # Kullanıcının mevcut envanterinden tarif öner
-                            try:
-                                recommendations = recommender.recommend_recipes(user_id=user_id, max_recipes=5)
-                                logger.info(f"✅ Envanterden {len(recommendations)} tarif bulundu")
-                            except Exception as e:
-                                logger.error(f"❌ Envanter tarif arama hatası: {e}")
-                                recommendations = []
-                    except Exception as e:
-                        logger.error(f"❌ Fiş ürünleriyle tarif arama hatası: {e}")
-                        logger.info("🔧 Kullanıcı envanterinden tarif aranıyor")
-                        # Kullanıcının mevcut envanterinden tarif öner
-                        try:
-                            recommendations = recommender.recommend_recipes(user_id=user_id, max_recipes=5)
-                            logger.info(f"✅ Envanterden {len(recommendations)} tarif bulundu")
-                        except Exception as e2:
-                            logger.error(f"❌ Envanter tarif arama hatası: {e2}")
-                            recommendations = []
+                # Tarif önerisi (Spoonacular + çeviri ağ çağrıları) arka planda başlar,
+                # bu sırada ürünler envantere yazılır; envanter yedeği yazım bitene kadar bekler
+                inventory_ready = threading.Event()
+                recommendations_future = _RECOMMEND_EXECUTOR.submit(
+                    recommend_for_receipt, recommender, user_id, extracted_ingredients, inventory_ready
+                )
                 
                 # Ürünleri kullanıcı envanterine ekle (ENVANTERE NORMALIZE YAZIYORUZ — yukarıda zaten düzeltildi)
                 try:
@@ -809,6 +849,10 @@ def upload_file():
                     logger.info(f"📦 {added_count} ürün envantere eklendi")
                 except Exception as e:
                     logger.error(f"❌ Envanter ekleme hatası: {e}")
+                finally:
+                    inventory_ready.set()
+                
+                recommendations = recommendations_future.result()
                 
                 # ŞABLONDA GÖRÜNEN İSİMLERİ NORMALIZE'A ZORLA >>> EKLENDİ <<<
                 for p in receipt_products:
@@ -919,35 +963,12 @@ def api_process():
                 
                 logger.info(f"🔍 Fişten çıkarılan ürünler: {extracted_ingredients}")
                 
-                # Eğer fişte ürün bulunamadıysa normal user inventory kullan
-                if not extracted_ingredients:
-                    logger.info("❌ Fişte ürün bulunamadı, inventory kullanılıyor")
-                    recommendations = recommender.recommend_recipes(user_id=user_id, max_recipes=5)
-                else:
-                    # Fiş ürünlerini kullanarak tarif ara
-                    logger.info(f"🍽️ Fiş ürünleriyle tarif aranıyor: {extracted_ingredients[:5]}")
-                    try:
-                        recommendations = recommender.recommend_recipes_from_receipt(extracted_ingredients[:5], max_recipes=5, user_id=user_id)
-                        logger.info(f"✅ Fiş ürünleriyle {len(recommendations)} tarif bulundu")
-                        if not recommendations:
-                            logger.info("❌ Spoonacular API problemi - Kullanıcı envanterinden tarif aranıyor")
-                            # Kullanıcının mevcut envanterinden tarif öner
-                            try:
-                                recommendations = recommender.recommend_recipes(user_id=user_id, max_recipes=5)
-                                logger.info(f"✅ Envanterden {len(recommendations)} tarif bulundu")
-                            except Exception as e:
-                                logger.error(f"❌ Envanter tarif arama hatası: {e}")
-                                recommendations = []
-                    except Exception as e:
-                        logger.error(f"❌ Fiş ürünleriyle tarif arama hatası: {e}")
-                        logger.info("🔧 Kullanıcı envanterinden tarif aranıyor")
-                        # Kullanıcının mevcut envanterinden tarif öner
-                        try:
-                            recommendations = recommender.recommend_recipes(user_id=user_id, max_recipes=5)
-                            logger.info(f"✅ Envanterden {len(recommendations)} tarif bulundu")
-                        except Exception as e2:
-                            logger.error(f"❌ Envanter tarif arama hatası: {e2}")
-                            recommendations = []
+                # Tarif önerisi (Spoonacular + çeviri ağ çağrıları) arka planda başlar,
+                # bu sırada ürünler envantere yazılır; envanter yedeği yazım bitene kadar bekler
+                inventory_ready = threading.Event()
+                recommendations_future = _RECOMMEND_EXECUTOR.submit(
+                    recommend_for_receipt, recommender, user_id, extracted_ingredients, inventory_ready
+                )
                 
                 # Ürünleri kullanıcı envanterine ekle (ENVANTERE NORMALIZE YAZIYORUZ — yukarıda zaten düzeltildi)
                 try:
@@ -957,6 +978,10 @@ def api_process():
                     logger.info(f"📦 {added_count} ürün envantere eklendi")
                 except Exception as e:
                     logger.error(f"❌ Envanter ekleme hatası: {e}")
+                finally:
+                    inventory_ready.set()
+                
+                recommendations = recommendations_future.result()
                 
                 # JSON'a dönecek ürün isimlerini normalize'a zorlama >>> EKLENDİ <<<
                 for p in receipt_products:
@@ -1087,6 +1112,7 @@ def save_preferences():
             conn.commit()
             cursor.close()
             conn.close()
+            invalidate_user_preferences(user['user_id'])
             
             return jsonify({'success': True, 'message': 'Tercihler başarıyla kaydedildi'})
         else:
@@ -1168,6 +1194,7 @@ def save_preferences():
             
             conn.commit()
             conn.close()
+            invalidate_user_preferences(user['id'])
             
             return jsonify({'success': True, 'message': 'Tercihler başarıyla kaydedildi'})
         
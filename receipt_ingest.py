@@ -8,6 +8,7 @@ import hashlib
 import re
 import io
 import os
+import time
 import logging
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Optional, Tuple
@@ -15,6 +16,7 @@ from sqlalchemy.engine import Engine
 from sqlalchemy import select, text
 from sqlalchemy.exc import OperationalError
 from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path  # <-- FIX 1: safer enhanced filename handling
 
 from db import (
@@ -33,11 +35,39 @@ from db_normalizer import DBProductNormalizer
 from pattern_normalizer import PatternProductNormalizer
 from shelf_life_resolver import ShelfLifeResolver
 from product_normalizer_advanced import normalize_product_name
+from translate_utils import translate_batch
 
 logger = logging.getLogger(__name__)
 
 TESS_LANG = os.environ.get('OCR_LANG', 'tur+eng')
 
+# OCR ön işleme kernelleri (her çağrıda yeniden ayrılmasın)
+_KERNEL_2x2 = np.ones((2, 2), np.uint8)
+_SHARPEN = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+
+
+# receipt_normalizations'a yeni etiketler eklendikçe pattern'ler TTL ile yeniden yüklenir
+_PATTERN_TTL_S = 600
+
+
+@lru_cache(maxsize=1)
+def _pattern_normalizer(_ttl_bucket: int) -> PatternProductNormalizer:
+    # Pattern'ler DB'den yüklenir; zaman dilimi başına bir kez kurulur
+    return PatternProductNormalizer()
+
+
+def _get_pattern_normalizer() -> PatternProductNormalizer:
+    normalizer = _pattern_normalizer(int(time.monotonic() // _PATTERN_TTL_S))
+    # Yükleme hatası (geçici DB sorunu) boş pattern bırakır: önbellekte tutma, sonraki fiş yeniden dener
+    if not normalizer.patterns:
+        _pattern_normalizer.cache_clear()
+    return normalizer
+
+
+def _has_letters(name: str) -> bool:
+    # Harf içermeyen metin (kod, sayı, noktalama) çeviride değişmez: API'ye gitme
+    return any(ch.isalpha() for ch in name)
+
 
 def _read_file_bytes(path: str) -> bytes:
     with open(path, "rb") as f:
@@ -48,6 +78,13 @@ def sha256_hex(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
 
+def _load_image_bytes(path: str) -> Tuple[bytes, str]:
+    # Dosya bir kez okunur; aynı byte'lar hem decode hem hash için kullanılır.
+    # Önbellek yok: yüklemeler her seferinde yeni dosya adıyla gelir, anahtar hiç tekrar etmez
+    raw = _read_file_bytes(path)
+    return raw, sha256_hex(raw)
+
+
 def _deskew(gray: np.ndarray) -> np.ndarray:
     # threshold → edges → HoughLines ile açı tahmini
     thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
@@ -93,9 +130,8 @@ def _enhance_for_ocr(bgr: np.ndarray) -> np.ndarray:
     )
 
     # morfolojik temizlik (küçük gürültüleri temizle)
-    kernel = np.ones((2, 2), np.uint8)
-    opened = cv2.morphologyEx(thr, cv2.MORPH_OPEN, kernel, iterations=1)
-    closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel, iterations=1)
+    opened = cv2.morphologyEx(thr, cv2.MORPH_OPEN, _KERNEL_2x2, iterations=1)
+    closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, _KERNEL_2x2, iterations=1)
     return closed
 
 
@@ -105,9 +141,6 @@ def pil_from_ndarray(arr: np.ndarray) -> Image.Image:
 
 def _enhance_receipt_for_ocr(image_path: str) -> str:
     """OCR için görüntüyü iyileştir"""
-    import cv2
-    import numpy as np
-
     # Görüntüyü oku
     img = cv2.imread(image_path)
     if img is None:
@@ -124,8 +157,7 @@ def _enhance_receipt_for_ocr(image_path: str) -> str:
     denoised = cv2.medianBlur(enhanced, 3)
 
     # Kenar keskinleştirme
-    kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-    sharpened = cv2.filter2D(denoised, -1, kernel)
+    sharpened = cv2.filter2D(denoised, -1, _SHARPEN)
 
     # Adaptive threshold
     thresh = cv2.adaptiveThreshold(
@@ -173,6 +205,13 @@ def _clean_price(s: str) -> Optional[float]:
         return None
 
 
+# _clean_product_name son temizlik adımları
+# Fiyat ayıklama, noktalama çevrilmeden önce yapılmalı ("163,50" → "163 50" olmasın)
+_NAME_CLEANUP_RX = re.compile(r"\b\d+[.,]\d+\b|YUKKA|SOGR")
+_NAME_OCR_FIXES = {"YUKKA": "YUFKA", "SOGR": "SOĞAN"}
+_NAME_PUNCT_TO_SPACE = str.maketrans(dict.fromkeys("xX*«»#,.-", " "))
+
+
 def _clean_product_name(name: str) -> str:
     """
     Ürün adını temizle: miktar bilgilerini, sayıları, özel karakterleri ayıkla
@@ -286,18 +325,11 @@ def _clean_product_name(name: str) -> str:
         if keyword in name.upper():
             return ""  # Gıda dışı ürünü filtrele
 
-    # OCR hatalarını düzelt (minimal)
-    name = name.replace("YUKKA", "YUFKA")
-    name = name.replace("SOGR", "SOĞAN")
-
-    # Sadece fiyatları ayıkla
-    name = re.sub(r'\b\d+[.,]\d+\b', '', name)  # 163,50 gibi fiyatları ayıkla
+    # OCR hatalarını düzelt (minimal) + 163,50 gibi fiyatları ayıkla — tek geçiş
+    name = _NAME_CLEANUP_RX.sub(lambda m: _NAME_OCR_FIXES.get(m.group(0), ""), name)
 
-    # Özel karakterleri boşluğa çevir (silme)
-    name = re.sub(r'[xX*«»#,.\-]', ' ', name)
-
-    # Çoklu boşlukları tek boşluğa çevir
-    name = re.sub(r'\s+', ' ', name).strip()
+    # Özel karakterleri boşluğa çevir (silme), çoklu boşlukları tek boşluğa indir
+    name = " ".join(name.translate(_NAME_PUNCT_TO_SPACE).split())
 
     # Çok kısa isimleri filtrele ama çok katı olma
     if len(name) < 3:
@@ -319,48 +351,16 @@ _PRODUCT_PATTERNS = [
         r"(?P<name>.+?)\s+[\d.,]+\s*(KG|G|GR|LT|L)\s*[Xx]\s*[\d.,]+\s*=\s*(?P<price>\d+[.,]\d+)",
         re.IGNORECASE,
     ),
-    # 4) ÜRÜN ADI 408 x14,95 (yeni format)
-    re.compile(r"(?P<name>.+?)\s+\d+\s+[Xx](?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 5) ÜRÜN ADI 408 x2 ,00 (boşluklu format)
-    re.compile(r"(?P<name>.+?)\s+\d+\s+[Xx](?P<price>\d+[.,]\s*\d+)\s*$", re.IGNORECASE),
-    # 6) ÜRÜN ADI 408 *3,50 (yıldızlı format)
-    re.compile(r"(?P<name>.+?)\s+\d+\s+\*(?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 7) ÜRÜN ADI 408 «3,50 (çift tırnak format)
-    re.compile(r"(?P<name>.+?)\s+\d+\s+«(?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 8) ÜRÜN ADI 408 »4,45 (çift tırnak format)
-    re.compile(r"(?P<name>.+?)\s+\d+\s+»(?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 9) ÜRÜN ADI #08 x1,15 (hash format)
-    re.compile(r"(?P<name>.+?)\s+#\d+\s+[Xx](?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 10) ÜRÜN ADI %08 *6,99 (yüzde format)
-    re.compile(r"(?P<name>.+?)\s+%\d+\s+\*(?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 11) ÜRÜN ADI %08 xİ,25 (yüzde x format)
-    re.compile(r"(?P<name>.+?)\s+%\d+\s+[Xx](?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 12) ÜRÜN ADI 408 0,95 (basit format)
+    # 4) ÜRÜN ADI 408 x14,95 / 408 x2 ,00 / 408 x2, 29 / 408 xİ,25 (kod + x fiyat, boşluklu varyantlar dahil)
+    re.compile(r"(?P<name>.+?)\s+\d+\s+[Xx](?P<price>\d+\s*[.,]\s*\d+)\s*$", re.IGNORECASE),
+    # 5) ÜRÜN ADI 408 *3,50 / 408 «3,50 / 408 »4,45 (yıldız / çift tırnak format)
+    re.compile(r"(?P<name>.+?)\s+\d+\s+[*«»](?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
+    # 6) ÜRÜN ADI #08 x1,15 / %08 *6,99 / %08 xİ,25 (hash / yüzde format)
+    re.compile(r"(?P<name>.+?)\s+[#%]\d+\s+[Xx*](?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
+    # 7) ÜRÜN ADI 408 0,95 (basit format)
     re.compile(r"(?P<name>.+?)\s+\d{3}\s+(?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 13) ÜRÜN ADI 408 x2 ,00 (boşluklu x format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+[.,]\s*\d+)\s*$", re.IGNORECASE),
-    # 14) ÜRÜN ADI 408 *3 99 (boşluklu yıldız format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+\*(?P<price>\d+\s+\d+)\s*$", re.IGNORECASE),
-    # 15) ÜRÜN ADI 408 x2, 29 (virgüllü format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+,\s*\d+)\s*$", re.IGNORECASE),
-    # 16) ÜRÜN ADI 408 x2 ,00 (boşluklu virgül format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+\s*,\s*\d+)\s*$", re.IGNORECASE),
-    # 17) ÜRÜN ADI 408 *3 99 (boşluklu yıldız format)
+    # 8) ÜRÜN ADI 408 *3 99 (boşluklu yıldız format)
     re.compile(r"(?P<name>.+?)\s+\d{3}\s+\*(?P<price>\d+\s+\d+)\s*$", re.IGNORECASE),
-    # 18) ÜRÜN ADI 408 «31,95 (çift tırnak format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+«(?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 19) ÜRÜN ADI 408 x1, 00 (boşluklu format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+,\s+\d+)\s*$", re.IGNORECASE),
-    # 20) ÜRÜN ADI 408 x2, 29 (virgüllü format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+,\d+)\s*$", re.IGNORECASE),
-    # 21) ÜRÜN ADI 408 xİ,25 (özel karakter format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+[.,]\d+)\s*$", re.IGNORECASE),
-    # 22) ÜRÜN ADI 408 x2, 29 (boşluklu virgül format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+,\s+\d+)\s*$", re.IGNORECASE),
-    # 23) ÜRÜN ADI 408 x1, 00 (boşluklu format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+,\s+\d+)\s*$", re.IGNORECASE),
-    # 24) ÜRÜN ADI 408 x2, 29 (virgüllü format)
-    re.compile(r"(?P<name>.+?)\s+\d{3}\s+[Xx](?P<price>\d+,\d+)\s*$", re.IGNORECASE),
 ]
 
 _SKIP_IF_CONTAINS = [
@@ -392,6 +392,10 @@ _SKIP_IF_CONTAINS = [
     "BARKOD", "PLU", "ÜRÜN KODU", "URUN KODU", "AÇIKLAMA", "ACIKLAMA",
 ]
 
+# Skip listesi tek alternation olarak derlenir: satır ~70 ayrı `in` yerine tek geçişte taranır
+_SKIP_RX = re.compile("|".join(sorted(map(re.escape, _SKIP_IF_CONTAINS), key=len, reverse=True)))
+_PRICE_RX = re.compile(r"\d+[.,]\d{1,2}")
+
 
 def _parse_product_line(text: str) -> Optional[Dict[str, str]]:
     """
@@ -402,7 +406,7 @@ def _parse_product_line(text: str) -> Optional[Dict[str, str]]:
     
     # Skip kontrolü: Eğer skip keyword'ü varsa AMA fiyat yoksa skip et
     # Fiyat varsa skip etme! (ÖNEMLİ: Bu sayede "YUMURTA %08 *12,00" gibi satırları yakalıyoruz)
-    if any(k in up for k in _SKIP_IF_CONTAINS) and not re.search(r"\d+[.,]\d{1,2}", up):
+    if _SKIP_RX.search(up) and not _PRICE_RX.search(up):
         return None
 
     # Pattern matching ile ürünleri çıkar
@@ -445,9 +449,21 @@ class ReceiptOCRIngestor:
     ):
         if tesseract_path:
             pytesseract.pytesseract.tesseract_cmd = tesseract_path
+        # `tesseract --version` alt süreci fiş başına değil, bir kez çalışsın
+        self._tess_version = str(pytesseract.get_tesseract_version())
         self.engine = engine
         self.currency = currency  # para kullanmıyoruz; None bırakmak OK
 
+        # Ingestor process_receipt_image'da fişler arasında paylaşılır (_get_ingestor):
+        # DB normalizer corpus'u ve resolver sıcak kalır
+        self._db_norm = DBProductNormalizer(self.engine)
+        self._shelf = ShelfLifeResolver()
+
+    @property
+    def _pattern_norm(self) -> PatternProductNormalizer:
+        # Pattern normalizer kendi TTL'iyle yenilenir; örnekte sabitlenmez
+        return _get_pattern_normalizer()
+
     def _ocr_variants(self, pil_img: Image.Image) -> List[Dict]:
         variants = []
         for cfg, tag in _tess_configs():
@@ -513,8 +529,7 @@ class ReceiptOCRIngestor:
         if purchase_date is None:
             purchase_date = datetime.now(timezone.utc)
 
-        raw_bytes = _read_file_bytes(image_path)
-        img_hash = sha256_hex(raw_bytes)
+        raw_bytes, img_hash = _load_image_bytes(image_path)
 
         # 1) Görseli oku + iyileştir
         bgr = cv2.imdecode(np.frombuffer(raw_bytes, np.uint8), cv2.IMREAD_COLOR)
@@ -558,6 +573,9 @@ class ReceiptOCRIngestor:
 
         while True:
             try:
+                # Tanılama amaçlı çeviri için normalize isimler (commit sonrası toplu çevrilir)
+                normalized_names: List[str] = []
+
                 with _transaction(self.engine) as conn:
                     # a) Aynı görsel daha önce eklenmiş mi?
                     dup = conn.execute(
@@ -585,7 +603,7 @@ class ReceiptOCRIngestor:
                         total_amount=None,  # kullanılmıyor
                         currency=None,      # kullanılmıyor
                         ocr_engine="tesseract",
-                        ocr_version=str(pytesseract.get_tesseract_version()),  # <-- str()
+                        ocr_version=self._tess_version,
                         status="parsed",
                         image_path=image_path,
                     ).returning(receipts.c.receipt_id)
@@ -614,10 +632,8 @@ class ReceiptOCRIngestor:
                             )
 
                     # e) receipt_items + normalize + inventory_batches
-                    normalizer = DBProductNormalizer(self.engine)
-                    resolver = ShelfLifeResolver()
-
                     parsed_products = best["products"] if best else []
+                    resolved: List[Tuple[Dict, Optional[int], Optional[int], Optional[str]]] = []
                     for p in parsed_products:
                         # 1) Satırı ekle
                         ins_stmt = (
@@ -641,8 +657,7 @@ class ReceiptOCRIngestor:
                         item_id = conn.execute(ins_stmt).scalar_one()
 
                         # 2) Pattern-based Normalizasyon + DB fallback
-                        pattern_normalizer = PatternProductNormalizer()
-                        pattern_result = pattern_normalizer.normalize(p["name"])
+                        pattern_result = self._pattern_norm.normalize(p["name"])
 
                         normalized_name = None
                         confidence = 0.0
@@ -651,27 +666,21 @@ class ReceiptOCRIngestor:
                         if pattern_result and pattern_result.confidence >= 0.6:
                             normalized_name = pattern_result.normalized_name
                             confidence = pattern_result.confidence
-                            logger.info(f"🎯 Pattern normalization: '{p['name']}' → '{normalized_name}' ({confidence:.2f})")
+                            logger.info("🎯 Pattern normalization: '%s' → '%s' (%.2f)", p["name"], normalized_name, confidence)
                         else:
                             # Fallback: DB normalizasyon
-                            match = normalizer.match_one(conn, p["name"])
+                            match = self._db_norm.match_one(conn, p["name"])
                             if match:
                                 normalized_name = getattr(match, 'normalized_name', p["name"])
                                 confidence = getattr(match, 'score', 0.5)
-                                logger.info(f"🗄️ DB normalization: '{p['name']}' → '{normalized_name}' ({confidence:.2f})")
+                                logger.info("🗄️ DB normalization: '%s' → '%s' (%.2f)", p["name"], normalized_name, confidence)
                             else:
                                 normalized_name = p["name"].strip().title()
                                 confidence = 0.3
-                                logger.info(f"⚠️ Basic cleanup: '{p['name']}' → '{normalized_name}' ({confidence:.2f})")
+                                logger.info("⚠️ Basic cleanup: '%s' → '%s' (%.2f)", p["name"], normalized_name, confidence)
 
-                        # Çeviri işlemi
-                        from translate_utils import translate_text
-                        translated_name = translate_text(normalized_name, "tr", "en")
-
-                        # Çeviriyi dosyaya kaydet (geçici)
-                        if translated_name and translated_name != normalized_name:
-                            with open("clean_translations.txt", "a", encoding="utf-8") as f:
-                                f.write(f"{normalized_name} -> {translated_name}\n")
+                        # Çeviri transaction içinde yapılmaz; isim biriktirilir
+                        normalized_names.append(normalized_name)
 
                         # 2.5) pid/cid/norm_name belirle (stok ve shelf-life için)
                         pid = None
@@ -683,7 +692,7 @@ class ReceiptOCRIngestor:
                             norm_name = getattr(match, "normalized_name", norm_name)
 
                         # Alias'ı gerçek pid ile güncelle (varsa)
-                        normalizer.upsert_alias(conn, p["name"], pid)  # <-- FIX 3: None değil pid
+                        self._db_norm.upsert_alias(conn, p["name"], pid)  # <-- FIX 3: None değil pid
 
                         # 3) receipt_items güncelle (sadece bilinen id'ler varsa)
                         if pid or cid:
@@ -697,18 +706,25 @@ class ReceiptOCRIngestor:
                                 )
                             )
 
+                        resolved.append((p, pid, cid, norm_name))
+
+                    # 4) Bilinen ürünlerin default storage'ını tek sorguda çek
+                    pids = {pid for _, pid, _, _ in resolved if pid}
+                    storage_map: Dict[int, int] = {}
+                    if pids:
+                        for r in conn.execute(
+                            select(products.c.product_id, products.c.default_storage_id)
+                            .where(products.c.product_id.in_(pids))
+                        ):
+                            if r.default_storage_id:
+                                storage_map[r.product_id] = int(r.default_storage_id)
+
+                    for p, pid, cid, norm_name in resolved:
                         # 5) Raf ömrü ve stok partisi
                         # varsayılan storage: ürünün defaultu varsa onu kullan, yoksa None
-                        storage_id = None
-                        if pid:
-                            st = conn.execute(
-                                select(products.c.default_storage_id)
-                                .where(products.c.product_id == pid)
-                            ).first()
-                            if st and st.default_storage_id:
-                                storage_id = int(st.default_storage_id)
-
-                        days = resolver.resolve_days(
+                        storage_id = storage_map.get(pid) if pid else None
+
+                        days = self._shelf.resolve_days(
                             conn=conn,
                             product_id=pid,
                             category_id=cid,
@@ -744,14 +760,32 @@ class ReceiptOCRIngestor:
                                 p["original_line"],
                             )
 
-                    # Transaction başarıyla bitti
-                    return {
+                    persisted = {
                         "success": True,
                         "message": f"Receipt parsed and persisted ({len(best['products']) if best else 0} items).",
                         "receipt_id": rid,
                         "products": best["products"] if best else [],
                     }
 
+                # Transaction başarıyla bitti (commit edildi) — çeviri ve dosya I/O artık kilit tutmaz.
+                # Çeviriler yalnızca bu tanılama dosyası için: tek toplu istek, yalnızca DEBUG'da
+                if normalized_names and logger.isEnabledFor(logging.DEBUG):
+                    to_translate = [name for name in normalized_names if name and _has_letters(name)]
+                    translated = translate_batch(to_translate, source_lang="tr", target_lang="en") if to_translate else {}
+                    translation_log = [
+                        f"{name} -> {translated[name]}\n"
+                        for name in dict.fromkeys(to_translate)
+                        if translated.get(name) and translated[name] != name
+                    ]
+                    try:
+                        if translation_log:
+                            with open("clean_translations.txt", "a", encoding="utf-8") as f:
+                                f.write("".join(translation_log))
+                    except OSError as e:
+                        logger.warning(f"clean_translations.txt yazılamadı: {e}")
+
+                return persisted
+
             except OperationalError as e:
                 attempt += 1
                 logger.warning(f"DB operational error; retrying {attempt}/{MAX_RETRIES}: {e}")
@@ -762,122 +796,182 @@ class ReceiptOCRIngestor:
                 raise
 
 
+def _safe_get(obj, key, default=None):
+    # Güvenli alan okuma (dict veya Row obje olabilir); dict.get / getattr(default) hata atmaz
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+# shelf_life_rules küçük ve neredeyse statik: ürün bazlı günler bellekte tutulur, TTL ile yenilenir
+_SHELF_LIFE_TTL_S = 600
+# Sorgu bir kez kurulur; aynı TextClause nesnesi SQLAlchemy'nin derlenmiş ifade önbelleğine denk gelir
+_SHELF_LIFE_STMT = text("""
+    SELECT product_id, MIN(days) AS days
+    FROM shelf_life_rules
+    WHERE product_id IS NOT NULL
+    GROUP BY product_id
+""")
+
+
+@lru_cache(maxsize=1)
+def _shelf_life_map(_ttl_bucket: int) -> Dict[int, int]:
+    with get_engine().connect() as conn:
+        rows = conn.execute(_SHELF_LIFE_STMT).all()
+    return {r.product_id: r.days for r in rows}
+
+
+def _product_shelf_life_days() -> Dict[int, int]:
+    # Zaman dilimi değişince lru_cache(maxsize=1) eski haritayı atar ve tabloyu yeniden okur
+    return _shelf_life_map(int(time.monotonic() // _SHELF_LIFE_TTL_S))
+
+
+# Arayüz tarafı gıda dışı filtre (normalize edilmiş, büyük harf isim üzerinde aranır)
+_NON_FOOD_KEYWORDS = (
+    'PEÇETE', 'POŞET', 'PLASTIK', 'PLASTIC', 'BAG', 'POSET',
+    'REMY',  # Marka/alkol (büyük harf)
+    'BARKARAMELLI4SGCANGA', 'BARKARAMELLİASGCANGA',  # OCR hatası
+    'BLUME', 'DESTAN', 'EFSANE', 'ŞAFAK', 'İLKGÜN', 'DAPHNE',  # Markalar
+    'KART', 'CARD', 'İNDİRİM', 'DISCOUNT', 'PROMOSYON',
+    'NUMARA', 'NUMBER', 'ADRES', 'ADDRESS', 'TELEFON', 'PHONE',
+    'TARİH', 'DATE', 'SAAT', 'TIME', 'TOPLAM', 'TOTAL',
+    'KDV', 'TAX', 'VERGİ', 'PARA', 'MONEY', 'KREDİ', 'CREDIT',
+)
+_NON_FOOD_RX = re.compile("|".join(sorted(map(re.escape, _NON_FOOD_KEYWORDS), key=len, reverse=True)))
+
+# İsimden kategori tahmini: grup adı = category_id. Alternatif sırası öncelik sırasıdır
+# (match + lookahead → ilk tutan kategori kazanır, isimdeki konumu değil)
+_CATEGORY_RX = re.compile(
+    r"(?=.*?(?P<c1>ZEYTİN))"
+    r"|(?=.*?(?P<c3>TAVUK|BAGET))"
+    r"|(?=.*?(?P<c5>KAKAO))"
+    r"|(?=.*?(?P<c7>PEYNİR))"
+    r"|(?=.*?(?P<c11>PİRİNÇ|ŞEHRİYE|YUFKA|MAKARNA))"
+    r"|(?=.*?(?P<c18>\bUNU?\b))"
+    r"|(?=.*?(?P<c19>ŞEKER))"
+    r"|(?=.*?(?P<c20>SÜT))"
+)
+
+# Kategori bazlı varsayılan raf ömrü (gün)
+_CATEGORY_SHELF_LIFE: Dict[int, int] = {
+    1: 30,   # Zeytin - 30 gün
+    3: 3,    # Tavuk - 3 gün
+    5: 365,  # Kakao - 1 yıl
+    7: 7,    # Peynir - 1 hafta
+    11: 30,  # Diğer - 30 gün
+    18: 365, # Un - 1 yıl
+    19: 365, # Şeker - 1 yıl
+    20: 3,   # Süt - 3 gün
+}
+
+
+def _classify_product(raw_name: str) -> Tuple[str, float, str, Optional[str]]:
+    """
+    Ürün başına isim hattı: normalize → kırp/büyük harf → gıda dışı kontrolü.
+    (isim, güven, büyük harf isim, yakalanan gıda dışı kelime veya None) döner.
+    """
+    name, confidence = normalize_product_name(raw_name)
+    upper_name = name.strip().upper()
+    non_food = _NON_FOOD_RX.search(upper_name)
+    return name, confidence, upper_name, (non_food.group(0) if non_food else None)
+
+
+def _guess_category_id(upper_name: str) -> Optional[int]:
+    # Büyük harf isimden kategori tahmini (_CATEGORY_RX öncelik sırasıyla)
+    m = _CATEGORY_RX.match(upper_name)
+    return int(m.lastgroup[1:]) if m else None
+
+
+# Paylaşılan ingestor TTL ile yeniden kurulur ki corpus'a yeni ürün/alias'lar girsin
+_INGESTOR_TTL_S = 600
+
+
+@lru_cache(maxsize=1)
+def _shared_ingestor(engine: Engine, _ttl_bucket: int) -> ReceiptOCRIngestor:
+    ingestor = ReceiptOCRIngestor(engine)
+    # Corpus paylaşılmadan önce yüklenir: eşzamanlı ilk match_one çağrıları aynı listeyi doldurmasın
+    try:
+        with engine.connect() as conn:
+            ingestor._db_norm._load_corpus(conn)
+    except Exception as e:
+        logger.warning(f"Normalizer corpus önceden yüklenemedi: {e}")
+    return ingestor
+
+
+def _get_ingestor(engine: Engine) -> ReceiptOCRIngestor:
+    return _shared_ingestor(engine, int(time.monotonic() // _INGESTOR_TTL_S))
+
+
 def process_receipt_image(image_path: str, user_id: int) -> Dict:
     """
     Fiş görselini işle ve sonuçları döndür
     Web arayüzü için wrapper fonksiyon
     """
-    import time
     start_time = time.time()
 
     try:
-        # ReceiptOCRIngestor'u kullan
-        engine = get_engine()
-        ingestor = ReceiptOCRIngestor(engine)
+        # Paylaşılan ReceiptOCRIngestor'u kullan
+        ingestor = _get_ingestor(get_engine())
 
         # Fişi işle
         result = ingestor.process_and_persist(image_path, user_id=user_id)
 
         processing_time = time.time() - start_time
 
-        # result Row/dict olabilir: güvenli kontrol
-        success = False
-        products = []
-        try:
-            if isinstance(result, dict):
-                success = result.get("success", False)
-                products = result.get("products", [])
-            else:
-                success = getattr(result, "success", False)
-                products = getattr(result, "products", [])
-        except Exception:
-            success = False
-            products = []
-
-        if result and success:
-            # Receipt ID'yi al
-            receipt_id = None
-            if isinstance(result, dict):
-                receipt_id = result.get("receipt_id")
-            else:
-                receipt_id = getattr(result, "receipt_id", None)
-
-            # Ürünleri formatla
-            formatted_products = []
+        # result Row/dict olabilir: girişte bir kez dict'e çevir
+        if not isinstance(result, dict):
+            result = {
+                "success": getattr(result, "success", False),
+                "products": getattr(result, "products", []),
+                "receipt_id": getattr(result, "receipt_id", None),
+            }
+        success = result.get("success", False)
+        products = result.get("products", [])
+        rid = result.get("receipt_id")
+
+        if success:
+            # Ürünleri formatla — 1. faz: filtrele/sınıflandır, alanları tuple olarak topla
+            kept: List[Tuple] = []
             logger.info(f"Toplam {len(products)} ürün bulundu")
 
-            # Normalizer'ı başlat
-            pattern_normalizer = PatternProductNormalizer()
+            # Normalize edilmiş ürünlerin raf ömrü kuralları — bellekteki tablo kopyasından.
+            # Aşağıdaki döngü DB'ye gitmez: tablo tek bağlantı + tek sorguyla yüklenir (TTL'e kadar önbellekte)
+            shelf_map: Dict[int, int] = {}
+            if any(_safe_get(p, "normalized_product_id") for p in products):
+                try:
+                    shelf_map = _product_shelf_life_days()
+                except Exception as e:
+                    logger.warning(f"Raf ömrü bilgisi alınamadı: {e}")
 
             for i, product in enumerate(products):
-                logger.info(f"Ürün {i+1}: {product}")
+                logger.debug("Ürün %d: %s", i + 1, product)
 
                 # Veri yapısına göre alanları al
-                if isinstance(product, dict):
-                    line_text = product.get("line_text", "")
-                else:
-                    line_text = getattr(product, "line_text", "")
+                line_text = _safe_get(product, "line_text", "")
 
                 # HAM METIN: OCR'dan gelen
                 raw_name = line_text
-                logger.info(f"🔍 HAM OCR metni: '{raw_name}'")
+                logger.info("🔍 HAM OCR metni: '%s'", raw_name)
 
                 # 🎯 GELİŞMİŞ NORMALİZASYON SİSTEMİ
                 # 3 katmanlı: OCR Fix → Pattern Match → Fuzzy DB Match
-                name, confidence = normalize_product_name(raw_name)
-                
-                logger.info(f"✅ NORMALİZE: '{raw_name}' → '{name}' (güven: {confidence:.2f})")
-
-                # Gıda dışı ürünleri filtrele (her durumda çalışır)
-                non_food_keywords = [
-                    'PEÇETE', 'POŞET', 'PLASTIK', 'PLASTIC', 'BAG', 'POSET',
-                    'REMY',  # Marka/alkol (büyük harf)
-                    'BARKARAMELLI4SGCANGA', 'BARKARAMELLİASGCANGA',  # OCR hatası
-                    'BLUME', 'DESTAN', 'EFSANE', 'ŞAFAK', 'İLKGÜN', 'DAPHNE',  # Markalar
-                    'KART', 'CARD', 'İNDİRİM', 'DISCOUNT', 'PROMOSYON',
-                    'NUMARA', 'NUMBER', 'ADRES', 'ADDRESS', 'TELEFON', 'PHONE',
-                    'TARİH', 'DATE', 'SAAT', 'TIME', 'TOPLAM', 'TOTAL',
-                    'KDV', 'TAX', 'VERGİ', 'PARA', 'MONEY', 'KREDİ', 'CREDIT'
-                ]
-
-                is_non_food = False
-                for keyword in non_food_keywords:
-                    if keyword in name.upper():
-                        logger.info(f"🚫 Non-food item filtered: '{name}' (contains '{keyword}')")
-                        is_non_food = True
-                        break
-
-                if is_non_food:
+                # Gıda dışı filtre de aynı geçişte (her durumda çalışır)
+                name, confidence, upper_name, non_food = _classify_product(raw_name)
+
+                logger.info("✅ NORMALİZE: '%s' → '%s' (güven: %.2f)", raw_name, name, confidence)
+
+                if non_food:
+                    logger.info("🚫 Non-food item filtered: '%s' (contains '%s')", name, non_food)
                     continue  # Bu ürünü atla, bir sonrakine geç
 
                 # ⚠️ ÖNEMLİ: name zaten normalize edildi, tekrar temizleme YAPMA!
                 # Sadece çok kısa (< 2 karakter) isimleri filtrele
-                if len(name.strip()) < 2:
-                    logger.warning(f"⚠️ Çok kısa ürün adı atlandı: '{name}'")
+                if len(upper_name) < 2:
+                    logger.warning("⚠️ Çok kısa ürün adı atlandı: '%s'", name)
                     continue
 
-                # Normalize edilmiş ürün ID'si varsa products tablosundan adı al
-                name_en = ""
-                
-                # ⭐ İngilizce çeviri yap (normalize edilmiş isimden)
-                try:
-                    from translate_utils import translate_text
-                    name_en = translate_text(name, source_lang="tr", target_lang="en")
-                    if not name_en or len(name_en) < 2 or name_en == name:
-                        name_en = name  # Çeviri başarısız olursa Türkçe ismini kullan
-                    logger.info(f"🌐 Çeviri: '{name}' → '{name_en}'")
-                except Exception as e:
-                    logger.warning(f"⚠️ Çeviri hatası: {e}")
-                    name_en = name  # Hata olursa Türkçe ismini kullan
-
-                # Güvenli alan okuma (dict veya Row obje olabilir)
-                def _safe_get(obj, key, default=None):
-                    try:
-                        if isinstance(obj, dict):
-                            return obj.get(key, default)
-                        return getattr(obj, key, default)
-                    except Exception:
-                        return default
+                # ⭐ İngilizce çeviri normalize edilmiş isimden yapılır (döngü sonrası toplu)
+                name_src = name
 
                 price = str(_safe_get(product, "price", ""))
                 original_line = line_text
@@ -888,6 +982,7 @@ def process_receipt_image(image_path: str, user_id: int) -> Dict:
                     alt_name = _clean_product_name(line_text)
                     if len(alt_name) > len(name):
                         name = alt_name
+                        upper_name = name.upper()
 
                 # Raf ömrü bilgisi ekle (varsayılan değerler)
                 shelf_life_days = None
@@ -901,86 +996,63 @@ def process_receipt_image(image_path: str, user_id: int) -> Dict:
                     category_id = None
 
                 if normalized_product_id:
-                    # Normalize edilmiş ürün için raf ömrü bilgisi al
-                    try:
-                        with engine.connect() as conn:
-                            from sqlalchemy import text
-                            result = conn.execute(text("""
-                                SELECT slr.days
-                                FROM shelf_life_rules slr
-                                WHERE slr.product_id = :product_id
-                                LIMIT 1
-                            """), {"product_id": normalized_product_id})
-                            row = result.first()
-                            if row:
-                                shelf_life_days = row.days
-                    except Exception as e:
-                        logger.warning(f"Raf ömrü bilgisi alınamadı: {e}")
+                    # Normalize edilmiş ürün için raf ömrü bilgisi (döngü öncesi toplu çekildi)
+                    shelf_life_days = shelf_map.get(normalized_product_id)
 
                 # Eğer raf ömrü bilgisi yoksa, kategori bazlı varsayılan değerler
                 if not shelf_life_days:
                     # Kategori yoksa isimden tahmin et
                     if not category_id and name:
-                        upper_name = name.upper()
-                        if 'ZEYTİN' in upper_name:
-                            category_id = 1
-                        elif 'TAVUK' in upper_name or 'BAGET' in upper_name:
-                            category_id = 3
-                        elif 'KAKAO' in upper_name:
-                            category_id = 5
-                        elif 'PEYNİR' in upper_name:
-                            category_id = 7
-                        elif 'PİRİNÇ' in upper_name or 'ŞEHRİYE' in upper_name or 'YUFKA' in upper_name or 'MAKARNA' in upper_name:
-                            category_id = 11
-                        elif 'UN' in upper_name:
-                            category_id = 18
-                        elif 'ŞEKER' in upper_name:
-                            category_id = 19
-                        elif 'SÜT' in upper_name:
-                            category_id = 20
+                        category_id = _guess_category_id(upper_name)
                     if category_id:
                         # Kategori bazlı varsayılan raf ömrü
-                        category_shelf_life = {
-                            1: 30,   # Zeytin - 30 gün
-                            3: 3,    # Tavuk - 3 gün
-                            5: 365,  # Kakao - 1 yıl
-                            7: 7,    # Peynir - 1 hafta
-                            11: 30,  # Diğer - 30 gün
-                            18: 365, # Un - 1 yıl
-                            19: 365, # Şeker - 1 yıl
-                            20: 3,   # Süt - 3 gün
-                        }
-                        shelf_life_days = category_shelf_life.get(category_id, 7)  # Varsayılan 7 gün
-                        logger.info(f"🔍 Ürün: {name}, Kategori: {category_id}, Raf ömrü: {shelf_life_days} gün")
+                        shelf_life_days = _CATEGORY_SHELF_LIFE.get(category_id, 7)  # Varsayılan 7 gün
+                        logger.info("🔍 Ürün: %s, Kategori: %s, Raf ömrü: %s gün", name, category_id, shelf_life_days)
                     else:
                         shelf_life_days = 7  # Varsayılan 7 gün
-                        logger.info(f"🔍 Kategori bilgisi yok, varsayılan raf ömrü: {shelf_life_days} gün")
+                        logger.info("🔍 Kategori bilgisi yok, varsayılan raf ömrü: %s gün", shelf_life_days)
 
                 # ✅ name zaten normalize edildi (satır 834-839), TEKRAR YAPMA!
-                logger.info(f"📤 Arayüze gönderilen ürün adı: '{name}' (original: '{line_text}')")
-
-                formatted_products.append({
+                logger.debug("📤 Arayüze gönderilen ürün adı: '%s' (original: '%s')", name, line_text)
+
+                kept.append((
+                    name, name_src, price, original_line,
+                    shelf_life_days, normalized_product_id, category_id,
+                ))
+
+            # İngilizce çeviriler: fişte tekrar eden isimler bir kez, hepsi tek toplu istekle.
+            # Harf içermeyen metin çeviride değişmez: API'ye gitmez
+            to_translate = {src for _, src, *_ in kept if _has_letters(src)}
+            translations: Dict[str, str] = {}
+            if to_translate:
+                try:
+                    translations = translate_batch(to_translate, source_lang="tr", target_lang="en")
+                except Exception as e:
+                    logger.warning("⚠️ Çeviri hatası: %s", e)
+            name_en_map: Dict[str, str] = {}
+            for src in to_translate:
+                translated = translations.get(src, src)
+                # Çeviri başarısız olursa Türkçe ismini kullan
+                name_en_map[src] = translated if translated and len(translated) >= 2 else src
+                logger.info("🌐 Çeviri: '%s' → '%s'", src, name_en_map[src])
+
+            # 2. faz: filtreden geçen ürünlerden arayüz kayıtlarını tek comprehension'da kur
+            formatted_products = [
+                {
                     "name": name if name else "Ürün",
                     "normalized_text_tr": name if name else "Ürün",  # ⭐ Normalize edilmiş Türkçe isim
                     "name_tr": name if name else "Ürün",  # Fallback için
-                    "name_en": name_en if name_en else name,  # ⭐ İngilizce çeviri (yukarıda yapıldı)
-                    "normalized_text_en": name_en if name_en else name,  # Envanter için
+                    "name_en": name_en_map.get(name_src, name_src) or name,  # ⭐ İngilizce çeviri (yukarıda yapıldı)
+                    "normalized_text_en": name_en_map.get(name_src, name_src) or name,  # Envanter için
                     "price": price,
                     "original_line": original_line,
                     "shelf_life_days": shelf_life_days,
                     "normalized_product_id": normalized_product_id,
                     "category_id": category_id
-                })
-
-            # result Row/dict olabilir: güvenli al
-            rid = None
-            try:
-                if isinstance(result, dict):
-                    rid = result.get("receipt_id")
-                else:
-                    rid = getattr(result, "receipt_id", None)
-            except Exception:
-                rid = None
+                }
+                for (name, name_src, price, original_line,
+                     shelf_life_days, normalized_product_id, category_id) in kept
+            ]
 
             logger.info(f"✅ Receipt ID döndürülüyor: {rid}")
             return {
@@ -3,26 +3,348 @@
 """
 Raf ömrüne göre önceliklendirilmiş tarif önerisi sistemi
 """
+import heapq
+import json
 import logging
+import re
+from bisect import bisect_left
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import time
+import threading
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Optional, Tuple
 import translate_utils
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 from sqlalchemy import text
 from dotenv import load_dotenv
 
 from db import get_engine
-from translate_utils import translate_text
 
 # .env dosyasını yükle
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+def _build_http_session() -> requests.Session:
+    """Spoonacular için bağlantı havuzlu, 5xx'te geri çekilerek tekrar deneyen oturum"""
+    session = requests.Session()
+    # 429 burada tekrar denenmez: adaptör içi denemeler _SPOONACULAR_LIMITER'dan jeton almaz,
+    # hız sınırı kotayı yiyen ek istekler yerine limiter'a bırakılır
+    retry = Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504],
+                  raise_on_status=False)  # son yanıt çağırana döner, mevcut status kontrolleri geçerli kalır
+    session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry))
+    return session
+
+
+# RecipeRecommender her istekte yeniden kurulur; TCP/TLS bağlantılarının korunması için oturum modül düzeyinde
+_HTTP_SESSION = _build_http_session()
+
+
+class _TokenBucket:
+    """Saniyede `rate` jeton üreten, en fazla `capacity` birikebilen iş parçacığı güvenli kova"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Bir jeton alınana kadar bekle"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Spoonacular kotası: eşzamanlı istek patlamaları 429'a düşmeden önce burada yumuşatılır
+_SPOONACULAR_RATE = float(os.getenv("SPOONACULAR_RATE_PER_SEC", "5"))
+if _SPOONACULAR_RATE <= 0:
+    raise ValueError(f"SPOONACULAR_RATE_PER_SEC pozitif olmalı: {_SPOONACULAR_RATE}")
+# Kapasite en az 1 jeton: saniyede 1'in altındaki oranlarda da kova bir isteği karşılayabilmeli
+_SPOONACULAR_LIMITER = _TokenBucket(rate=_SPOONACULAR_RATE, capacity=max(1.0, _SPOONACULAR_RATE))
+
+# Kullanıcı tercihleri: üç liste tek gidiş-dönüşte; boş liste için json_agg NULL döner
+_USER_PREFERENCES_SQL = text("""
+    SELECT
+        (SELECT json_agg(a.name)
+           FROM user_allergies ua
+           JOIN allergens a ON ua.allergen_id = a.allergen_id
+          WHERE ua.user_id = :user_id) AS allergies,
+        (SELECT json_agg(p.canonical_name_en)
+           FROM user_dislikes ud
+           JOIN products p ON ud.product_id = p.product_id
+          WHERE ud.user_id = :user_id) AS dislikes,
+        (SELECT json_agg(json_build_object('code', dp.code, 'label', dp.label))
+           FROM user_dietary_preferences udp
+           JOIN dietary_preferences dp ON udp.pref_id = dp.pref_id
+          WHERE udp.user_id = :user_id) AS diets
+""")
+
+
+
+
+class _TTLCache:
+    """Süreli ve boyut sınırlı bellek içi önbellek; dolunca en eski kayıt atılır"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: Dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+# Spoonacular tarif detaylarının 10 güne kadar saklanmasına izin veriyor
+_DETAILS_CACHE = _TTLCache(maxsize=4096, ttl=timedelta(days=10).total_seconds())
+# findByIngredients yanıtları daha kısa süre tutulur
+_SEARCH_CACHE = _TTLCache(maxsize=1024, ttl=timedelta(hours=1).total_seconds())
+# Kullanıcı tercihleri nadiren değişir; kaydetme uç noktası invalidate_user_preferences ile temizler
+_PREFERENCES_CACHE = _TTLCache(maxsize=1024, ttl=60)
+# Tercihlerden türetilen sabit arama parametreleri; tercihlerle aynı ömür
+_SEARCH_PARAMS_CACHE = _TTLCache(maxsize=1024, ttl=60)
+
+
+def invalidate_user_preferences(user_id: int) -> None:
+    """Tercihler değiştiğinde kullanıcının önbellekteki kaydını düşür"""
+    _PREFERENCES_CACHE.pop(user_id)
+    _SEARCH_PARAMS_CACHE.pop(user_id)
+
+# Malzeme → ürün adında aranacak eş anlamlılar (TR/EN, tekil/çoğul)
+_INGREDIENT_ALIASES: Dict[str, List[str]] = {
+    # Yumurta
+    'eggs': ['yumurta', 'egg'],
+    'egg': ['yumurta', 'eggs'],
+
+    # Süt ürünleri
+    'milk': ['süt', 'milk'],
+    'cheese': ['peynir', 'cheese'],
+    'cream cheese': ['krem peynir', 'cream cheese'],
+    'mozzarella': ['mozzarella', 'peynir'],
+
+    # Sebzeler
+    'tomatoes': ['domates', 'tomato'],
+    'tomato': ['domates', 'tomatoes'],
+    'onions': ['soğan', 'onion'],
+    'onion': ['soğan', 'onions'],
+    'potatoes': ['patates', 'potato'],
+    'potato': ['patates', 'potatoes'],
+
+    # Tahıllar
+    'bread': ['ekmek', 'bread'],
+    'rice': ['pirinç', 'rice'],
+    'pasta': ['makarna', 'pasta'],
+
+    # Et
+    'chicken': ['tavuk', 'chicken'],
+    'beef': ['biftek', 'beef', 'dana'],
+    'meat': ['et', 'meat'],
+
+    # Diğer
+    'butter': ['tereyağı', 'butter'],
+    'oil': ['yağ', 'oil'],
+    'salt': ['tuz', 'salt'],
+    'pepper': ['biber', 'pepper'],
+}
+
+# Çoğul anahtarların tekil karşılığı (ör. tomatoes → tomato); eş anlamlı tablosundan türetilir
+_CANONICAL_INGREDIENT: Dict[str, str] = {
+    key: alias
+    for key, aliases in _INGREDIENT_ALIASES.items()
+    for alias in aliases
+    if alias in _INGREDIENT_ALIASES and alias != key and key.startswith(alias)
+}
+
+
+# Kalan güne göre öncelik basamakları (düşük gün = yüksek öncelik); bisect ile seçilir
+# get_user_inventory: <=0 → 100 (çok acil), <=3 → 80 (acil), <=7 → 60 (orta), <=14 → 40 (düşük), sonrası 20
+_INVENTORY_DAY_STEPS = (0, 3, 7, 14)
+_INVENTORY_PRIORITIES = (100.0, 80.0, 60.0, 40.0, 20.0)
+
+# _get_user_inventory: kalan gün ve öncelik (<=3 → 90, <=7 → 70, <=14 → 50, sonrası 30)
+# veritabanında hesaplanır; satırlar doğrudan ProductWithShelfLife'a eşlenir
+_USER_INVENTORY_SQL = text("""
+    SELECT id, product_name, product_name_en, days_remaining,
+           CASE WHEN days_remaining <= 3 THEN 90
+                WHEN days_remaining <= 7 THEN 70
+                WHEN days_remaining <= 14 THEN 50
+                ELSE 30
+           END AS priority_score
+    FROM (
+        SELECT id, product_name, product_name_en, expiry_date,
+               EXTRACT(DAY FROM expiry_date - LOCALTIMESTAMP)::int AS days_remaining
+        FROM user_inventory
+        WHERE user_id = :user_id AND expiry_date > NOW()
+        ORDER BY expiry_date ASC
+        LIMIT :limit
+    ) ui
+    ORDER BY expiry_date ASC
+""")
+
+# Tarif önerisinde SKT'si en yakın N ürün yeterli: aramaya ilk 10 malzeme gider,
+# öncelik skoru da acil ürünlerden gelir. (user_id, expiry_date) indeksiyle sıralama gerekmez
+_RECOMMEND_INVENTORY_LIMIT = 50
+
+# Benzer malzeme grupları: malzeme bir gruptaysa, aynı gruptan herhangi bir ürün "benzer" sayılır
+_SIMILAR_GROUPS: Tuple[Tuple[str, ...], ...] = (
+    ('süt', 'peynir', 'yoğurt', 'milk', 'cheese', 'yogurt'),                                # dairy
+    ('domates', 'soğan', 'patates', 'havuç', 'tomato', 'onion', 'potato', 'carrot'),        # vegetables
+    ('ekmek', 'pirinç', 'makarna', 'un', 'bread', 'rice', 'pasta', 'flour'),                # grains
+    ('tavuk', 'et', 'biftek', 'yumurta', 'chicken', 'meat', 'beef', 'egg'),                 # protein
+    ('tuz', 'biber', 'baharat', 'salt', 'pepper', 'spice'),                                 # spices
+)
+
+# Eksik listesinde gösterilmeyecek malzemeler
+# Çok temel malzemeler - genelde her evde bulunur
+_BASIC_INGREDIENTS = frozenset({
+    'salt', 'pepper', 'oil', 'butter', 'flour', 'sugar', 'garlic', 'onion',
+    'tuz', 'biber', 'yağ', 'tereyağı', 'un', 'şeker', 'sarımsak', 'soğan',
+    'water', 'su', 'vinegar', 'sirke', 'lemon', 'limon', 'herbs', 'otlar'
+})
+# Baharatlar ve soslar - opsiyonel
+_OPTIONAL_INGREDIENTS = frozenset({
+    'sauce', 'sos', 'spice', 'baharat', 'seasoning', 'herb', 'ot',
+    'condiment', 'dressing', 'marinade', 'marine'
+})
+
+
+def _alternation(words) -> "re.Pattern":
+    """Kelime listesinden tek geçişte arayan regex (uzun olan önce denenir)"""
+    return re.compile("|".join(map(re.escape, sorted(set(words), key=len, reverse=True))))
+
+
+_SKIP_MISSING_WORDS = _BASIC_INGREDIENTS | _OPTIONAL_INGREDIENTS
+_WORD_RX = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=2048)
+def _is_skipped_missing(ingredient: str) -> bool:
+    """Eksik malzeme temel/opsiyonel mi: kelime (ve basit tekil hali) kümesi kesişimi.
+    Aynı malzeme adları tariflerde sık tekrar eder; sonuç ad başına bir kez hesaplanır."""
+    words = _WORD_RX.findall(ingredient.lower())
+    tokens = set(words)
+    tokens.update(w[:-1] for w in words if w.endswith('s'))
+    return not tokens.isdisjoint(_SKIP_MISSING_WORDS)
+
+
+@lru_cache(maxsize=1024)
+def _alias_pattern(ingredient_name: str) -> Optional["re.Pattern"]:
+    """Malzeme adında geçen anahtarların tüm eş anlamlılarını ürün adında arayan regex"""
+    values = [v for key, aliases in _INGREDIENT_ALIASES.items() if key in ingredient_name for v in aliases]
+    return _alternation(values) if values else None
+
+
+@lru_cache(maxsize=1024)
+def _similar_pattern(ingredient_name: str) -> Optional["re.Pattern"]:
+    """Malzemenin düştüğü grupların tüm öğelerini ürün adında arayan regex"""
+    items = [item for group in _SIMILAR_GROUPS if any(i in ingredient_name for i in group) for item in group]
+    return _alternation(items) if items else None
+
+
+def _canonicalize_ingredients(ingredients: List[str]) -> Tuple[str, ...]:
+    """Sıra, büyük/küçük harf ve çoğul farkı gözetmeyen önbellek anahtarı"""
+    canonical = set()
+    for ingredient in ingredients:
+        name = ingredient.strip().lower()
+        if name:
+            canonical.add(_CANONICAL_INGREDIENT.get(name, name))
+    return tuple(sorted(canonical))
+
+
+def _json(response: requests.Response):
+    """Spoonacular yanıt gövdesini ayrıştır
+
+    Ham bayt doğrudan json.loads'a verilir; requests'in metin çözme/karakter
+    seti tahmini adımı atlanır. Tüm yanıtlar buradan geçtiği için daha hızlı
+    bir ayrıştırıcı gerekirse tek noktadan değiştirilebilir.
+    """
+    return json.loads(response.content)
+
+
+# Spoonacular yanıtlarından yalnızca kullanılan alanlar tutulur: önbellekteki kayıtlar küçülür,
+# skor/filtre döngüleri dar sözlükler üzerinde döner. Malzemeler {'name': ...} olarak kalır
+# (arayüz şablonları da yalnızca ing.name okur)
+_SEARCH_FIELDS = ('id', 'title', 'image')
+_DETAIL_FIELDS = ('id', 'title', 'image', 'readyInMinutes', 'servings', 'sourceUrl',
+                  'instructions', 'summary', 'cuisines', 'dishTypes')
+
+
+def _project_search_result(recipe: Dict) -> Dict:
+    """findByIngredients kaydını dar biçime indir"""
+    projected = {key: recipe[key] for key in _SEARCH_FIELDS if key in recipe}
+    projected['usedIngredients'] = [{'name': ing.get('name', '')} for ing in recipe.get('usedIngredients') or ()]
+    projected['missedIngredients'] = [{'name': ing.get('name', '')} for ing in recipe.get('missedIngredients') or ()]
+    return projected
+
+
+def _project_details(recipe_data: Dict) -> Dict:
+    """Tarif detayını _get_detailed_recipes'in okuduğu alanlara indir"""
+    return {key: recipe_data[key] for key in _DETAIL_FIELDS if key in recipe_data}
+
+
+# Toplu detay isteği başarısız olursa tarif başına çağrılar için paralel işçi sayısı
+_DETAIL_FETCH_WORKERS = 8
+
+
+# Talimat adımlarındaki HTML etiketleri
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# Ham fiş adı temizliği (recommend_recipes): işaret kontrolü, önce x3,45 gibi adet/fiyat,
+# sonra sayılar ve özel karakterler tek geçişte, en son fazla boşluklar
+_RECEIPT_MARKER_RE = re.compile(r'[*x#]|408|443')
+_RECEIPT_QTY_RE = re.compile(r'[xX]\d+[,.]?\d*')
+_RECEIPT_NOISE_RE = re.compile(r'\d+[,.]?\d*|[*#]')
+_MULTI_SPACE_RE = re.compile(r'\s+')
+
+
+def _join_instructions(instructions_data) -> str:
+    """analyzedInstructions listesini HTML'den arındırılmış tek metne çevir"""
+    if not instructions_data:
+        return ''
+    # HTML taglarını temizleyip adımları tek geçişte birleştir
+    return ' '.join(
+        _HTML_TAG_RE.sub('', step_text)
+        for step_group in instructions_data
+        for step in step_group.get('steps', ())
+        if (step_text := step.get('step', ''))
+    )
+
+
+@dataclass(slots=True, frozen=True)
 class ProductWithShelfLife:
     """Raf ömrü bilgisi olan ürün"""
     product_id: int
@@ -32,8 +354,15 @@ class ProductWithShelfLife:
     storage_type: str
     open_state: str
     priority_score: float
+    # Eşleştirme döngülerinde her karşılaştırmada lower() çağrılmasın diye bir kez hesaplanır
+    name_en_lower: str = field(init=False, repr=False, compare=False)
+    name_tr_lower: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'name_en_lower', (self.name_en or '').lower())
+        object.__setattr__(self, 'name_tr_lower', (self.name_tr or '').lower())
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RecipeRecommendation:
     """Tarif önerisi"""
     recipe_id: int
@@ -59,12 +388,16 @@ class RecipeRecommender:
         self.spoonacular_api_key = os.getenv("SPOONACULAR_API_KEY")
         self.base_url = "https://api.spoonacular.com/recipes"
         self.engine = get_engine()
+        self.http = _HTTP_SESSION
         
         if not self.spoonacular_api_key:
             raise ValueError("SPOONACULAR_API_KEY bulunamadı!")
     
     def get_user_preferences(self, user_id: int = 1) -> Dict:
         """Kullanıcının kişiselleştirme tercihlerini getir"""
+        cached = _PREFERENCES_CACHE.get(user_id)
+        if cached is not None:
+            return cached
         with self.engine.connect() as conn:
             preferences = {
                 'allergies': [],
@@ -73,45 +406,20 @@ class RecipeRecommender:
                 'liked_categories': []
             }
             
-            # Alerjileri getir
-            result = conn.execute(text("""
-                SELECT a.name 
-                FROM user_allergies ua
-                JOIN allergens a ON ua.allergen_id = a.allergen_id
-                WHERE ua.user_id = :user_id
-            """), {"user_id": user_id})
-            preferences['allergies'] = [row[0] for row in result]
-            
-            # Sevilmeyen ürünleri getir
-            result = conn.execute(text("""
-                SELECT p.canonical_name_en 
-                FROM user_dislikes ud
-                JOIN products p ON ud.product_id = p.product_id
-                WHERE ud.user_id = :user_id
-            """), {"user_id": user_id})
-            preferences['dislikes'] = [row[0] for row in result]
+            # Alerjiler, sevilmeyen ürünler ve diyet tercihleri tek sorguda (JSON dizileri)
+            row = conn.execute(_USER_PREFERENCES_SQL, {"user_id": user_id}).one()
+            preferences['allergies'] = row.allergies or []
+            preferences['dislikes'] = row.dislikes or []
+            preferences['dietary_preferences'] = row.diets or []
+            # Filtrelerde tekrar tekrar lower() çağrılmasın diye küçük harfli kümeler bir kez hazırlanır
+            preferences['allergy_terms'] = frozenset(a.lower() for a in preferences['allergies'])
+            preferences['dislike_terms'] = frozenset(d.lower() for d in preferences['dislikes'])
             
-            # Diyet tercihlerini getir
-            result = conn.execute(text("""
-                SELECT dp.code, dp.label 
-                FROM user_dietary_preferences udp
-                JOIN dietary_preferences dp ON udp.pref_id = dp.pref_id
-                WHERE udp.user_id = :user_id
-            """), {"user_id": user_id})
-            preferences['dietary_preferences'] = [{'code': row[0], 'label': row[1]} for row in result]
-            
-            # Geçmiş tarif tercihlerinden kategori analizi
-            result = conn.execute(text("""
-                SELECT COUNT(*) as count, 'unknown' as category
-                FROM recipe_recommendations 
-                WHERE user_id = :user_id AND clicked_at IS NOT NULL
-                GROUP BY category
-                ORDER BY count DESC
-                LIMIT 5
-            """), {"user_id": user_id})
-            preferences['liked_categories'] = [row[1] for row in result]
+            # liked_categories: recipe_recommendations'da kategori kolonu olmadığından
+            # şimdilik boş; gerçek kategori verisi gelince buradan doldurulur
             
             logger.info(f"🔍 Kullanıcı {user_id} tercihleri: {preferences}")
+            _PREFERENCES_CACHE.set(user_id, preferences)
             return preferences
     
     def get_user_inventory(self, user_id: int = 1) -> List[ProductWithShelfLife]:
@@ -133,17 +441,24 @@ class RecipeRecommender:
                 JOIN products p ON ib.product_id = p.product_id
                 LEFT JOIN product_translations pt ON p.product_id = pt.product_id 
                     AND pt.source_lang = 'en' AND pt.target_lang = 'tr'
-                LEFT JOIN shelf_life_rules slr ON p.product_id = slr.product_id
+                -- Parti başına tek kural: önce ürün kuralı, yoksa kategori kuralı;
+                -- ürünün varsayılan saklama yeri ve kapalı (sealed) durum tercih edilir
+                LEFT JOIN LATERAL (
+                    SELECT r.days, r.open_state, r.storage_id
+                    FROM shelf_life_rules r
+                    WHERE r.product_id = p.product_id
+                       OR (r.product_id IS NULL AND r.category_id = p.category_id)
+                    ORDER BY (r.product_id IS NULL),
+                             (r.storage_id IS NOT DISTINCT FROM p.default_storage_id) DESC,
+                             (r.open_state = 'sealed') DESC
+                    LIMIT 1
+                ) slr ON TRUE
                 LEFT JOIN storage s ON slr.storage_id = s.storage_id
                 WHERE ib.user_id = :user_id
                 AND ib.qty > 0
                 AND ib.status = 'in_stock'
                 AND (ib.expected_expiry_date IS NULL OR ib.expected_expiry_date > CURRENT_DATE)
-                ORDER BY 
-                    CASE 
-                        WHEN ib.expected_expiry_date IS NOT NULL THEN ib.expected_expiry_date
-                        ELSE CURRENT_DATE + INTERVAL '30 days'
-                    END ASC
+                ORDER BY COALESCE(ib.expected_expiry_date, CURRENT_DATE + 30) ASC
             """), {"user_id": user_id})
             
             products = []
@@ -158,16 +473,7 @@ class RecipeRecommender:
                     days_remaining = 30  # Varsayılan
                 
                 # Öncelik skoru hesapla (düşük gün = yüksek öncelik)
-                if days_remaining <= 0:
-                    priority_score = 100.0  # Çok acil
-                elif days_remaining <= 3:
-                    priority_score = 80.0   # Acil
-                elif days_remaining <= 7:
-                    priority_score = 60.0   # Orta
-                elif days_remaining <= 14:
-                    priority_score = 40.0   # Düşük
-                else:
-                    priority_score = 20.0   # Çok düşük
+                priority_score = _INVENTORY_PRIORITIES[bisect_left(_INVENTORY_DAY_STEPS, days_remaining)]
                 
                 products.append(ProductWithShelfLife(
                     product_id=row.product_id,
@@ -181,6 +487,33 @@ class RecipeRecommender:
             
             return products
     
+    def _spoonacular_get(self, url: str, params: Dict) -> requests.Response:
+        """Hız sınırlayıcıdan jeton alıp Spoonacular'a GET (429/5xx tekrarları oturumda)"""
+        _SPOONACULAR_LIMITER.acquire()
+        return self.http.get(url, params=params, timeout=30)
+    
+    def _build_search_params(self, user_id: int, preferences: Dict) -> Tuple[Dict, Tuple[str, ...]]:
+        """Kullanıcının sabit findByIngredients parametreleri ve diyet önbellek anahtarı"""
+        cached = _SEARCH_PARAMS_CACHE.get(user_id)
+        if cached is not None:
+            return cached
+        
+        params = {
+            'apiKey': self.spoonacular_api_key,
+            'ranking': 2,  # Minimize missing ingredients
+            'ignorePantry': False
+        }
+        
+        # Diyet tercihlerini ekle
+        diet_codes = [pref['code'] for pref in preferences['dietary_preferences']]
+        if diet_codes:
+            params['diet'] = ','.join(diet_codes)
+            logger.info(f"🥗 Diyet tercihleri: {diet_codes}")
+        
+        result = (params, tuple(sorted(diet_codes)))
+        _SEARCH_PARAMS_CACHE.set(user_id, result)
+        return result
+    
     def search_recipes_by_ingredients(self, ingredients: List[str], number: int = 10, user_id: int = 1) -> List[Dict]:
         """Malzemelerle tarif ara - kişiselleştirme ile"""
         try:
@@ -190,70 +523,41 @@ class RecipeRecommender:
             # Kullanıcı tercihlerini al
             preferences = self.get_user_preferences(user_id)
             
-            # Spoonacular API'ye istek gönder
+            # Spoonacular API'ye istek gönder; yalnızca malzeme ve sayı çağrıya özgü
             url = f"{self.base_url}/findByIngredients"
+            base_params, diet_key = self._build_search_params(user_id, preferences)
             params = {
+                **base_params,
                 'ingredients': ','.join(ingredients[:10]),  # Max 10 malzeme
                 'number': number * 2,  # Daha fazla tarif al, sonra filtrele
-                'apiKey': self.spoonacular_api_key,
-                'ranking': 2,  # Minimize missing ingredients
-                'ignorePantry': False
             }
             
-            # Diyet tercihlerini ekle
-            diet_codes = [pref['code'] for pref in preferences['dietary_preferences']]
-            if diet_codes:
-                params['diet'] = ','.join(diet_codes)
-                logger.info(f"🥗 Diyet tercihleri: {diet_codes}")
-            
-            logger.info(f"🌐 URL: {url}")
-            logger.info(f"📋 Params: {params}")
-            
-            response = requests.get(url, params=params, timeout=30)
-            logger.info(f"📡 Response Status: {response.status_code}")
-            
-            if response.status_code != 200:
-                logger.error(f"❌ API Error {response.status_code}: {response.text[:200]}")
-                return []
-            
-            recipes = response.json()
-            logger.info(f"✅ API Success: {len(recipes)} recipes found")
+            cache_key = (_canonicalize_ingredients(ingredients[:10]), params['number'], diet_key)
+            recipes = _SEARCH_CACHE.get(cache_key)
+            if recipes is None:
+                logger.info(f"🌐 URL: {url}")
+                logger.info(f"📋 Params: {params}")
+                
+                response = self._spoonacular_get(url, params)
+                logger.info(f"📡 Response Status: {response.status_code}")
+                
+                if response.status_code != 200:
+                    logger.error(f"❌ API Error {response.status_code}: {response.text[:200]}")
+                    return []
+                
+                recipes = [_project_search_result(recipe) for recipe in _json(response)]
+                _SEARCH_CACHE.set(cache_key, recipes)
+                logger.info(f"✅ API Success: {len(recipes)} recipes found")
+            else:
+                logger.info(f"♻️ Önbellekten: {len(recipes)} tarif")
+            # Filtreler tarif sözlüklerine skor yazar; önbellekteki kopyalar değişmesin
+            recipes = [dict(recipe) for recipe in recipes]
             
             # Kişiselleştirme filtreleri uygula
             filtered_recipes = self._apply_personalization_filters(recipes, preferences, ingredients)
             
-            # Her tarif için detaylı bilgileri al
-            detailed_recipes = []
-            for recipe in filtered_recipes[:5]:  # İlk 5 tarif için detay al
-                recipe_id = recipe.get('id')
-                if recipe_id:
-                    details = self.get_recipe_details(recipe_id)
-                    if details:
-                        # sourceUrl'i kontrol et ve düzelt
-                        source_url = details.get('sourceUrl', recipe.get('sourceUrl', ''))
-                        if not source_url or source_url == '':
-                            # Spoonacular'ın kendi tarif sayfasını kullan
-                            source_url = f"https://spoonacular.com/recipes/{recipe_id}"
-                        
-                        # Temel bilgileri detaylarla birleştir
-                        enhanced_recipe = {
-                            **recipe,  # Orijinal bilgiler
-                            'readyInMinutes': details.get('readyInMinutes', recipe.get('readyInMinutes', 0)),
-                            'servings': details.get('servings', recipe.get('servings', 0)),
-                            'sourceUrl': source_url,
-                            'instructions': details.get('instructions', ''),
-                            'summary': details.get('summary', ''),
-                            'cuisines': details.get('cuisines', []),
-                            'dishTypes': details.get('dishTypes', [])
-                        }
-                        detailed_recipes.append(enhanced_recipe)
-                    else:
-                        detailed_recipes.append(recipe)
-                else:
-                    detailed_recipes.append(recipe)
-            
-            logger.info(f"🔍 Detaylı bilgiler alındı: {len(detailed_recipes)} tarif")
-            return detailed_recipes
+            # İlk 5 tarifin detayları tek toplu istekle alınır
+            return self._get_detailed_recipes(filtered_recipes)
             
         except Exception as e:
             logger.error(f"❌ Tarif arama hatası: {e}")
@@ -262,26 +566,33 @@ class RecipeRecommender:
     def _apply_personalization_filters(self, recipes: List[Dict], preferences: Dict, ingredients: List[str]) -> List[Dict]:
         """Kişiselleştirme filtrelerini uygula"""
         filtered_recipes = []
+        ingredients_lower = [ingredient.lower() for ingredient in ingredients]
         
         for recipe in recipes:
+            # Malzeme adları tarif başına bir kez küçük harfe çevrilir
+            used_lower = [ing.get('name', '').lower() for ing in recipe.get('usedIngredients', [])]
+            missed_lower = [ing.get('name', '').lower() for ing in recipe.get('missedIngredients', [])]
+            
             # 1. Alerji kontrolü
-            if self._has_allergens(recipe, preferences['allergies']):
+            if self._has_allergens(used_lower + missed_lower, preferences['allergy_terms']):
                 logger.info(f"🚫 Tarif alerji nedeniyle filtrelendi: {recipe.get('title', 'Unknown')}")
                 continue
             
             # 2. Dislike kontrolü
-            if self._has_disliked_ingredients(recipe, preferences['dislikes']):
+            if self._has_disliked_ingredients(used_lower, preferences['dislike_terms']):
                 logger.info(f"👎 Tarif dislike nedeniyle filtrelendi: {recipe.get('title', 'Unknown')}")
                 continue
             
             # 3. Eksik malzeme kontrolü (çok fazla eksik malzeme varsa filtrele)
-            missing_count = len(recipe.get('missedIngredients', []))
+            missing_count = len(missed_lower)
             if missing_count > 8:  # Maksimum 8 eksik malzeme (daha esnek)
                 logger.info(f"❌ Çok fazla eksik malzeme ({missing_count}): {recipe.get('title', 'Unknown')}")
                 continue
             
             # 4. Kişiselleştirme skoru ekle
-            recipe['personalization_score'] = self._calculate_personalization_score(recipe, preferences, ingredients)
+            recipe['personalization_score'] = self._calculate_personalization_score(
+                used_lower, len(missed_lower), preferences, ingredients_lower
+            )
             
             filtered_recipes.append(recipe)
         
@@ -291,47 +602,35 @@ class RecipeRecommender:
         logger.info(f"🔍 {len(recipes)} tariften {len(filtered_recipes)} tanesi kişiselleştirme filtresinden geçti")
         return filtered_recipes
     
-    def _has_allergens(self, recipe: Dict, allergies: List[str]) -> bool:
-        """Tarifte alerjen var mı kontrol et"""
-        if not allergies:
+    @staticmethod
+    def _contains_term(ingredients_lower: List[str], terms: frozenset) -> bool:
+        """Küçük harfli malzemelerden biri terimlerden birini içeriyor (veya onun içinde geçiyor) mu"""
+        if not terms:
             return False
-        
-        # Kullanılan malzemeleri kontrol et
-        used_ingredients = [ing.get('name', '').lower() for ing in recipe.get('usedIngredients', [])]
-        missed_ingredients = [ing.get('name', '').lower() for ing in recipe.get('missedIngredients', [])]
-        all_ingredients = used_ingredients + missed_ingredients
-        
-        for allergy in allergies:
-            allergy_lower = allergy.lower()
-            for ingredient in all_ingredients:
-                if allergy_lower in ingredient or ingredient in allergy_lower:
+        # Birebir eşleşme tek küme kesişimiyle yakalanır; kısmi eşleşme için alt dize taraması
+        if terms.intersection(ingredients_lower):
+            return True
+        for term in terms:
+            for ingredient in ingredients_lower:
+                if term in ingredient or ingredient in term:
                     return True
-        
         return False
     
-    def _has_disliked_ingredients(self, recipe: Dict, dislikes: List[str]) -> bool:
-        """Tarifte sevilmeyen malzeme var mı kontrol et"""
-        if not dislikes:
-            return False
-        
-        # Kullanılan malzemeleri kontrol et
-        used_ingredients = [ing.get('name', '').lower() for ing in recipe.get('usedIngredients', [])]
-        
-        for dislike in dislikes:
-            dislike_lower = dislike.lower()
-            for ingredient in used_ingredients:
-                if dislike_lower in ingredient or ingredient in dislike_lower:
-                    return True
-        
-        return False
+    def _has_allergens(self, ingredients_lower: List[str], allergy_terms: frozenset) -> bool:
+        """Tarifte alerjen var mı kontrol et (kullanılan + eksik malzemeler)"""
+        return self._contains_term(ingredients_lower, allergy_terms)
     
-    def _calculate_personalization_score(self, recipe: Dict, preferences: Dict, ingredients: List[str]) -> float:
+    def _has_disliked_ingredients(self, used_lower: List[str], dislike_terms: frozenset) -> bool:
+        """Tarifte sevilmeyen malzeme var mı kontrol et (kullanılan malzemeler)"""
+        return self._contains_term(used_lower, dislike_terms)
+    
+    def _calculate_personalization_score(self, used_lower: List[str], missing_count: int,
+                                         preferences: Dict, ingredients_lower: List[str]) -> float:
         """Kişiselleştirme skoru hesapla"""
         score = 0.0
         
         # 1. Temel skor (eksik malzeme sayısına göre)
-        missing_count = len(recipe.get('missedIngredients', []))
-        used_count = len(recipe.get('usedIngredients', []))
+        used_count = len(used_lower)
         total_ingredients = missing_count + used_count
         
         if total_ingredients > 0:
@@ -347,23 +646,24 @@ class RecipeRecommender:
             score += 10
         
         # 4. Fiş malzemeleriyle eşleşme bonusu
-        used_ingredient_names = [ing.get('name', '').lower() for ing in recipe.get('usedIngredients', [])]
         ingredient_matches = 0
-        for ingredient in ingredients:
-            ingredient_lower = ingredient.lower()
-            for used_ing in used_ingredient_names:
+        for ingredient_lower in ingredients_lower:
+            for used_ing in used_lower:
                 if ingredient_lower in used_ing or used_ing in ingredient_lower:
                     ingredient_matches += 1
                     break
         
-        if len(ingredients) > 0:
-            match_ratio = ingredient_matches / len(ingredients)
+        if len(ingredients_lower) > 0:
+            match_ratio = ingredient_matches / len(ingredients_lower)
             score += match_ratio * 20  # %20'ye kadar eşleşme bonusu
         
         return min(score, 100.0)  # Maksimum 100 puan
     
     def get_recipe_details(self, recipe_id: int) -> Optional[Dict]:
         """Tarif detaylarını al"""
+        cached = _DETAILS_CACHE.get(recipe_id)
+        if cached is not None:
+            return cached
         try:
             # Ana bilgileri al
             url = f"{self.base_url}/{recipe_id}/information"
@@ -372,9 +672,9 @@ class RecipeRecommender:
                 'includeNutrition': False
             }
             
-            response = requests.get(url, params=params, timeout=30)
+            response = self._spoonacular_get(url, params)
             response.raise_for_status()
-            recipe_data = response.json()
+            recipe_data = _json(response)
             
             # Instructions'ı ayrı endpoint'ten al
             try:
@@ -384,27 +684,13 @@ class RecipeRecommender:
                     'stepBreakdown': True
                 }
                 
-                instructions_response = requests.get(instructions_url, params=instructions_params, timeout=30)
+                instructions_response = self._spoonacular_get(instructions_url, instructions_params)
                 if instructions_response.status_code == 200:
-                    instructions_data = instructions_response.json()
-                    if instructions_data and len(instructions_data) > 0:
-                        # Instructions'ı HTML formatından temizle ve birleştir
-                        steps = []
-                        for step_group in instructions_data:
-                            for step in step_group.get('steps', []):
-                                step_text = step.get('step', '')
-                                if step_text:
-                                    # HTML taglarını temizle
-                                    import re
-                                    clean_text = re.sub(r'<[^>]+>', '', step_text)
-                                    steps.append(clean_text)
-                        
-                        if steps:
-                            recipe_data['instructions'] = ' '.join(steps)
-                        else:
-                            recipe_data['instructions'] = ''
-                    else:
-                        recipe_data['instructions'] = ''
+                    recipe_data['instructions'] = _join_instructions(_json(instructions_response))
+                    recipe_data = _project_details(recipe_data)
+                    # Talimatları eksik (geçici hata) kayıtlar önbelleğe alınmaz
+                    _DETAILS_CACHE.set(recipe_id, recipe_data)
+                    return recipe_data
                 else:
                     recipe_data['instructions'] = ''
                     
@@ -412,22 +698,73 @@ class RecipeRecommender:
                 logger.warning(f"Instructions alma hatası {recipe_id}: {e}")
                 recipe_data['instructions'] = ''
             
-            return recipe_data
+            return _project_details(recipe_data)
             
         except Exception as e:
             logger.error(f"Tarif detay hatası {recipe_id}: {e}")
             return None
 
+    def get_recipe_details_bulk(self, recipe_ids: List[int]) -> Dict[int, Dict]:
+        """Birden çok tarifin detayını tek istekle al (informationBulk); {recipe_id: detay} döner"""
+        details_by_id = {}
+        missing_ids = []
+        for recipe_id in recipe_ids:
+            cached = _DETAILS_CACHE.get(recipe_id)
+            if cached is not None:
+                details_by_id[recipe_id] = cached
+            else:
+                missing_ids.append(recipe_id)
+        if not missing_ids:
+            return details_by_id
+        try:
+            url = f"{self.base_url}/informationBulk"
+            params = {
+                'ids': ','.join(map(str, missing_ids)),
+                'apiKey': self.spoonacular_api_key,
+                'includeNutrition': False
+            }
+            response = self._spoonacular_get(url, params)
+            response.raise_for_status()
+            for recipe_data in _json(response):
+                # Talimatlar toplu yanıtta gömülü gelir; ayrı analyzedInstructions çağrısı gerekmez
+                recipe_data['instructions'] = _join_instructions(recipe_data.get('analyzedInstructions'))
+                recipe_data = _project_details(recipe_data)
+                details_by_id[recipe_data.get('id')] = recipe_data
+                _DETAILS_CACHE.set(recipe_data.get('id'), recipe_data)
+            return details_by_id
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.warning(f"Toplu tarif detayı alınamadı, eksikler tek tek alınıyor: {e}")
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            # Kota/limit (402/429) ve diğer 4xx hatalarında tek tek çağrılar da aynı hatayı alır:
+            # yedek yola geçip kotayı N kat tüketme
+            if status is None or status < 500:
+                logger.warning(f"Toplu tarif detayı alınamadı (HTTP {status}), yedek yol atlanıyor: {e}")
+                return details_by_id
+            logger.warning(f"Toplu tarif detayı alınamadı (HTTP {status}), eksikler tek tek alınıyor: {e}")
+        except Exception as e:
+            # Yanıt bozuk: o ana kadar ayrıştırılanlarla yetin
+            logger.warning(f"Toplu tarif detayı işlenemedi: {e}")
+            return details_by_id
+
+        # Yedek yol: yalnızca hâlâ eksik olan tarifler için çağrılar paralel yürütülür
+        missing_ids = [rid for rid in missing_ids if rid not in details_by_id]
+        with ThreadPoolExecutor(max_workers=_DETAIL_FETCH_WORKERS) as pool:
+            details = pool.map(self.get_recipe_details, missing_ids)
+            details_by_id.update((rid, d) for rid, d in zip(missing_ids, details) if d)
+        return details_by_id
+
     def _get_detailed_recipes(self, recipes: List[Dict]) -> List[Dict]:
         """findByIngredients sonuçları için detayları getirip birleştirir."""
         detailed_recipes: List[Dict] = []
         try:
-            for recipe in recipes[:5]:  # İlk 5 tarif için detay al
+            top_recipes = recipes[:5]  # İlk 5 tarif için detay al
+            details_by_id = self.get_recipe_details_bulk(
+                [recipe['id'] for recipe in top_recipes if recipe.get('id')]
+            )
+            for recipe in top_recipes:
                 recipe_id = recipe.get('id')
-                if not recipe_id:
-                    detailed_recipes.append(recipe)
-                    continue
-                details = self.get_recipe_details(recipe_id)
+                details = details_by_id.get(recipe_id) if recipe_id else None
                 if not details:
                     detailed_recipes.append(recipe)
                     continue
@@ -454,10 +791,33 @@ class RecipeRecommender:
         logger.info(f"🔍 Detaylı bilgiler alındı: {len(detailed_recipes)} tarif")
         return detailed_recipes
     
-    def calculate_recipe_priority(self, recipe: Dict, user_products: List[ProductWithShelfLife]) -> Tuple[float, str]:
-        """Tarif önceliğini hesapla - geliştirilmiş eşleştirme"""
+    def _match_product(self, ingredient_name: str,
+                       user_products: List[ProductWithShelfLife]) -> Tuple[Optional[ProductWithShelfLife], float]:
+        """Malzemeye uyan ilk ürün ve skor çarpanı (doğrudan 1.0, benzer 0.7, yoksa None)"""
+        for product in user_products:
+            # Daha esnek eşleştirme
+            if self._ingredient_matches_product(ingredient_name, product):
+                return product, 1.0
+        
+        # Eşleşme bulunamadıysa, benzer ürün ara
+        for product in user_products:
+            if self._find_similar_ingredient(ingredient_name, product):
+                return product, 0.7  # %70 skor
+        
+        return None, 0.0
+    
+    def calculate_recipe_priority(self, recipe: Dict, user_products: List[ProductWithShelfLife],
+                                  match_cache: Optional[Dict[str, Tuple[Optional[ProductWithShelfLife], float]]] = None
+                                  ) -> Tuple[float, str]:
+        """Tarif önceliğini hesapla - geliştirilmiş eşleştirme
+        
+        match_cache: aynı ürün listesiyle puanlanan tarifler arasında paylaşılan
+        malzeme -> eşleşme sonucu sözlüğü; ortak malzemeler ürünlerle bir kez taranır.
+        """
         used_ingredients = recipe.get('usedIngredients', [])
         missed_ingredients = recipe.get('missedIngredients', [])
+        if match_cache is None:
+            match_cache = {}
         
         # Kullanılan malzemelerin öncelik skorlarını topla
         total_priority = 0
@@ -467,26 +827,16 @@ class RecipeRecommender:
         # Geliştirilmiş eşleştirme
         for ingredient in used_ingredients:
             ingredient_name = ingredient.get('name', '').lower()
-            matched = False
-            
-            for product in user_products:
-                # Daha esnek eşleştirme
-                if self._ingredient_matches_product(ingredient_name, product):
-                    total_priority += product.priority_score
-                    used_count += 1
-                    matched_ingredients.append(ingredient_name)
-                    matched = True
-                    break
+            match = match_cache.get(ingredient_name)
+            if match is None:
+                match = match_cache[ingredient_name] = self._match_product(ingredient_name, user_products)
+            product, weight = match
+            if product is None:
+                continue
             
-            # Eşleşme bulunamadıysa, benzer ürün ara
-            if not matched:
-                for product in user_products:
-                    if self._find_similar_ingredient(ingredient_name, product):
-                        total_priority += product.priority_score * 0.7  # %70 skor
-                        used_count += 1
-                        matched_ingredients.append(f"{ingredient_name} (~{product.name_tr})")
-                        matched = True
-                        break
+            total_priority += product.priority_score * weight
+            used_count += 1
+            matched_ingredients.append(ingredient_name if weight == 1.0 else f"{ingredient_name} (~{product.name_tr})")
         
         if used_count == 0:
             return 0.0, "no_match"
@@ -521,105 +871,25 @@ class RecipeRecommender:
     def _ingredient_matches_product(self, ingredient_name: str, product: ProductWithShelfLife) -> bool:
         """Malzeme-ürün eşleştirmesi"""
         # Temel eşleştirme
-        if (ingredient_name in product.name_en.lower() or 
-            ingredient_name in product.name_tr.lower()):
+        if (ingredient_name in product.name_en_lower or 
+            ingredient_name in product.name_tr_lower):
             return True
         
-        # Geliştirilmiş eşleştirme kuralları
-        matches = {
-            # Yumurta
-            'eggs': ['yumurta', 'egg'],
-            'egg': ['yumurta', 'eggs'],
-            
-            # Süt ürünleri
-            'milk': ['süt', 'milk'],
-            'cheese': ['peynir', 'cheese'],
-            'cream cheese': ['krem peynir', 'cream cheese'],
-            'mozzarella': ['mozzarella', 'peynir'],
-            
-            # Sebzeler
-            'tomatoes': ['domates', 'tomato'],
-            'tomato': ['domates', 'tomatoes'],
-            'onions': ['soğan', 'onion'],
-            'onion': ['soğan', 'onions'],
-            'potatoes': ['patates', 'potato'],
-            'potato': ['patates', 'potatoes'],
-            
-            # Tahıllar
-            'bread': ['ekmek', 'bread'],
-            'rice': ['pirinç', 'rice'],
-            'pasta': ['makarna', 'pasta'],
-            
-            # Et
-            'chicken': ['tavuk', 'chicken'],
-            'beef': ['biftek', 'beef', 'dana'],
-            'meat': ['et', 'meat'],
-            
-            # Diğer
-            'butter': ['tereyağı', 'butter'],
-            'oil': ['yağ', 'oil'],
-            'salt': ['tuz', 'salt'],
-            'pepper': ['biber', 'pepper'],
-        }
-        
-        for key, values in matches.items():
-            if key in ingredient_name:
-                for value in values:
-                    if value in product.name_en.lower() or value in product.name_tr.lower():
-                        return True
-        
-        return False
+        # Eş anlamlılar: malzeme başına bir kez derlenen tek regex
+        pattern = _alias_pattern(ingredient_name)
+        return bool(pattern and (pattern.search(product.name_en_lower) or pattern.search(product.name_tr_lower)))
     
     def _find_similar_ingredient(self, ingredient_name: str, product: ProductWithShelfLife) -> bool:
         """Benzer malzeme bulma"""
-        # Genel kategoriler
-        categories = {
-            'dairy': ['süt', 'peynir', 'yoğurt', 'milk', 'cheese', 'yogurt'],
-            'vegetables': ['domates', 'soğan', 'patates', 'havuç', 'tomato', 'onion', 'potato', 'carrot'],
-            'grains': ['ekmek', 'pirinç', 'makarna', 'un', 'bread', 'rice', 'pasta', 'flour'],
-            'protein': ['tavuk', 'et', 'biftek', 'yumurta', 'chicken', 'meat', 'beef', 'egg'],
-            'spices': ['tuz', 'biber', 'baharat', 'salt', 'pepper', 'spice'],
-        }
-        
-        for category, items in categories.items():
-            if any(item in ingredient_name for item in items):
-                if any(item in product.name_en.lower() or item in product.name_tr.lower() for item in items):
-                    return True
-        
-        return False
+        # Genel kategoriler (_SIMILAR_GROUPS); malzemenin gruplarından tek regex
+        pattern = _similar_pattern(ingredient_name)
+        return bool(pattern and (pattern.search(product.name_en_lower) or pattern.search(product.name_tr_lower)))
     
     def _filter_essential_missing(self, missing_products: List[str]) -> List[str]:
         """Eksik malzemeleri filtrele - sadece gerçekten gerekli olanları göster"""
-        # Çok temel malzemeler - genelde her evde bulunur
-        basic_ingredients = {
-            'salt', 'pepper', 'oil', 'butter', 'flour', 'sugar', 'garlic', 'onion',
-            'tuz', 'biber', 'yağ', 'tereyağı', 'un', 'şeker', 'sarımsak', 'soğan',
-            'water', 'su', 'vinegar', 'sirke', 'lemon', 'limon', 'herbs', 'otlar'
-        }
-        
-        # Baharatlar ve soslar - opsiyonel
-        optional_ingredients = {
-            'sauce', 'sos', 'spice', 'baharat', 'seasoning', 'baharat', 'herb', 'ot',
-            'condiment', 'sos', 'dressing', 'sos', 'marinade', 'marine'
-        }
-        
-        # Filtrelenmiş liste
-        essential_missing = []
-        for ingredient in missing_products:
-            ingredient_lower = ingredient.lower()
-            
-            # Temel malzemeleri atla
-            if any(basic in ingredient_lower for basic in basic_ingredients):
-                continue
-            
-            # Opsiyonel malzemeleri atla
-            if any(optional in ingredient_lower for optional in optional_ingredients):
-                continue
-            
-            # Gerçekten gerekli malzemeleri ekle
-            essential_missing.append(ingredient)
-        
-        return essential_missing[:3]  # Max 3 eksik malzeme göster
+        # Temel ve opsiyonel malzemeleri atla; ilk 3 gerekli malzeme bulununca dur
+        essential = (ingredient for ingredient in missing_products if not _is_skipped_missing(ingredient))
+        return list(islice(essential, 3))  # Max 3 eksik malzeme göster
     
     def recommend_recipes_from_receipt(self, ingredients: List[str], max_recipes: int = 10, user_id: int = 1) -> List[RecipeRecommendation]:
         """Fiş ürünlerinden tarif öner - kişiselleştirme ile"""
@@ -637,11 +907,6 @@ class RecipeRecommender:
         # Detaylı bilgileri al
         detailed_recipes = self._get_detailed_recipes(recipes)
         
-        # Tarif başlıklarını çevir
-        for recipe in detailed_recipes:
-            if 'title' in recipe:
-                recipe['title_tr'] = translate_text(recipe['title'], source_lang='en', target_lang='tr')
-
         # Fiş ürünlerini ProductWithShelfLife formatına dönüştür
         receipt_products = []
         for i, ingredient in enumerate(ingredients):
@@ -658,10 +923,13 @@ class RecipeRecommender:
                 priority_score=priority_score
             ))
         
-        # Tarifleri önceliklendir
-        recommendations = []
+        # Tarifleri önceliklendir (çevrilecek metinler toplanır, çeviri tek toplu istekle yapılır;
+        # daha önce çevrilenler translate_utils'in bellek/text_translations katmanından gelir)
+        scored = []
+        to_translate = set()
+        match_cache = {}
         for recipe in detailed_recipes:
-            priority_score, urgency = self.calculate_recipe_priority(recipe, receipt_products)
+            priority_score, urgency = self.calculate_recipe_priority(recipe, receipt_products, match_cache)
             
             if priority_score >= 0:  # Tüm tarifleri al (daha esnek)
                 used_products = [ing.get('name', '') for ing in recipe.get('usedIngredients', [])]
@@ -670,114 +938,45 @@ class RecipeRecommender:
                 # Eksik malzemeleri filtrele
                 essential_missing = self._filter_essential_missing(missing_products)
                 
-                # Türkçe çevirileri yap
-                try:
-                    title_tr = translate_utils.translate_text(recipe.get('title', ''))
-                    used_products_tr = [translate_utils.translate_text(product) for product in used_products[:3]]
-                    missing_products_tr = [translate_utils.translate_text(product) for product in essential_missing]
-                except Exception as e:
-                    logger.warning(f"Çeviri hatası: {e}")
-                    title_tr = recipe.get('title', '')
-                    used_products_tr = used_products[:3]
-                    missing_products_tr = essential_missing
-                
-                recommendations.append(RecipeRecommendation(
-                    recipe_id=recipe.get('id', 0),
-                    title=recipe.get('title', ''),
-                    title_tr=title_tr,
-                    image=recipe.get('image', ''),
-                    ready_in_minutes=recipe.get('readyInMinutes', 0),
-                    servings=recipe.get('servings', 0),
-                    source_url=recipe.get('sourceUrl', '') or f"https://spoonacular.com/recipes/{recipe.get('id', '')}" or "https://spoonacular.com/",
-                    used_products=used_products,
-                    used_products_tr=used_products_tr,
-                    missing_products=essential_missing,
-                    missing_products_tr=missing_products_tr,
-                    priority_score=priority_score,
-                    shelf_life_urgency=urgency,
-                    instructions=recipe.get('instructions', ''),
-                    summary=recipe.get('summary', '')
-                ))
-        
-        # Öncelik skoruna göre sırala
-        recommendations.sort(key=lambda x: x.priority_score, reverse=True)
+                to_translate.add(recipe.get('title', ''))
+                to_translate.update(used_products[:3])
+                to_translate.update(essential_missing)
+                scored.append((recipe, priority_score, urgency, used_products, essential_missing))
         
-        logger.info(f"✅ {len(recommendations)} öncelikli tarif hazırlandı")
-        return recommendations[:max_recipes]
-        """Kullanıcı için tarif öner"""
-        print(f"🍽️  Kullanıcı {user_id} için tarif önerisi hazırlanıyor...")
-        
-        # Kullanıcının envanterini al
-        user_products = self.get_user_inventory(user_id)
-        
-        if not user_products:
-            print("❌ Kullanıcının envanterinde ürün bulunamadı!")
-            return []
-        
-        print(f"📦 {len(user_products)} ürün bulundu")
-        
-        # En yüksek öncelikli ürünleri göster
-        sorted_products = sorted(user_products, key=lambda x: x.priority_score, reverse=True)
-        print(f"\n🔝 EN YÜKSEK ÖNCELİKLİ ÜRÜNLER:")
-        for i, product in enumerate(sorted_products[:5], 1):
-            urgency = "🔴 ÇOK ACİL" if product.priority_score >= 80 else \
-                     "🟠 ACİL" if product.priority_score >= 60 else \
-                     "🟡 ORTA" if product.priority_score >= 40 else "🟢 DÜŞÜK"
-            print(f"  {i}. {product.name_tr} - {product.days_remaining} gün kaldı {urgency}")
-        
-        # Tarif arama için malzeme listesi hazırla
-        ingredients = [p.name_en for p in sorted_products[:15]]  # En öncelikli 15 ürün
-        
-        print(f"\n🔍 Tarif aranıyor: {', '.join(ingredients[:5])}...")
-        
-        # Tarifleri ara
-        recipes = self.search_recipes_by_ingredients(ingredients, max_recipes * 2)
-        
-        if not recipes:
-            print("❌ Tarif bulunamadı!")
-            return []
-        
-        print(f"📋 {len(recipes)} tarif bulundu, önceliklendiriliyor...")
+        # Türkçe çevirileri yap
+        try:
+            tr = translate_utils.translate_batch(to_translate)
+        except Exception as e:
+            logger.warning(f"Çeviri hatası: {e}")
+            tr = {}
         
-        # Tarifleri önceliklendir
         recommendations = []
-        for recipe in recipes:
-            priority_score, urgency = self.calculate_recipe_priority(recipe, user_products)
+        for recipe, priority_score, urgency, used_products, essential_missing in scored:
+            title_tr = tr.get(recipe.get('title', ''), recipe.get('title', ''))
+            used_products_tr = [tr.get(product, product) for product in used_products[:3]]
+            missing_products_tr = [tr.get(product, product) for product in essential_missing]
             
-            if priority_score > 0:  # Sadece eşleşen tarifleri al
-                used_products = [ing.get('name', '') for ing in recipe.get('usedIngredients', [])]
-                missing_products = [ing.get('name', '') for ing in recipe.get('missedIngredients', [])]
-                
-                # Eksik malzemeleri filtrele - çok temel olanları çıkar
-                essential_missing = self._filter_essential_missing(missing_products)
-                
-                # Türkçe çevirileri yap
-                title_tr = translate_text(recipe.get('title', ''), "en", "tr")
-                used_products_tr = [translate_text(product, "en", "tr") for product in used_products[:3]]
-                missing_products_tr = [translate_text(product, "en", "tr") for product in essential_missing]
-                
-                recommendations.append(RecipeRecommendation(
-                    recipe_id=recipe.get('id', 0),
-                    title=recipe.get('title', ''),
-                    title_tr=title_tr,
-                    image=recipe.get('image', ''),
-                    ready_in_minutes=recipe.get('readyInMinutes', 0),
-                    servings=recipe.get('servings', 0),
-                    source_url=recipe.get('sourceUrl', '') or f"https://spoonacular.com/recipes/{recipe.get('id', '')}" or "https://spoonacular.com/",
-                    used_products=used_products,
-                    used_products_tr=used_products_tr,
-                    missing_products=essential_missing,
-                    missing_products_tr=missing_products_tr,
-                    priority_score=priority_score,
-                    shelf_life_urgency=urgency,
-                    instructions=recipe.get('instructions', ''),
-                    summary=recipe.get('summary', '')
-                ))
-        
-        # Öncelik skoruna göre sırala
-        recommendations.sort(key=lambda x: x.priority_score, reverse=True)
+            recommendations.append(RecipeRecommendation(
+                recipe_id=recipe.get('id', 0),
+                title=recipe.get('title', ''),
+                title_tr=title_tr,
+                image=recipe.get('image', ''),
+                ready_in_minutes=recipe.get('readyInMinutes', 0),
+                servings=recipe.get('servings', 0),
+                source_url=recipe.get('sourceUrl', '') or f"https://spoonacular.com/recipes/{recipe.get('id', '')}" or "https://spoonacular.com/",
+                used_products=used_products,
+                used_products_tr=used_products_tr,
+                missing_products=essential_missing,
+                missing_products_tr=missing_products_tr,
+                priority_score=priority_score,
+                shelf_life_urgency=urgency,
+                instructions=recipe.get('instructions', ''),
+                summary=recipe.get('summary', '')
+            ))
         
-        return recommendations[:max_recipes]
+        logger.info(f"✅ {len(recommendations)} öncelikli tarif hazırlandı")
+        # Öncelik skoruna göre ilk max_recipes (tam sıralama yerine kısmi yığın seçimi)
+        return heapq.nlargest(max_recipes, recommendations, key=lambda x: x.priority_score)
     
     def recommend_recipes(self, user_id: int = 1, max_recipes: int = 10) -> List[RecipeRecommendation]:
         """Kullanıcının envanterinden tarif öner"""
@@ -785,58 +984,65 @@ class RecipeRecommender:
         
         try:
             # Kullanıcının envanterini al
-            inventory = self._get_user_inventory(user_id)
+            inventory = self._get_user_inventory(user_id, limit=_RECOMMEND_INVENTORY_LIMIT)
             if not inventory:
                 logger.warning("❌ Envanter boş")
                 return []
             
-            # Envanterden malzeme isimlerini çıkar
-            ingredients = []
+            # Envanterden malzeme isimlerini çıkar; çevrilecekler sırası korunarak toplanır
+            # (ham ad, çevrilecek ad ya da None, temizlendi mi)
+            names = []
             for item in inventory:
                 try:
                     # Önce name_en'i kontrol et (temiz İngilizce)
                     if item.name_en and len(item.name_en.strip()) > 2:
-                        ingredients.append(item.name_en.strip())
+                        names.append((item.name_en.strip(), None, False))
                         logger.info(f"✅ İngilizce isim kullanıldı: {item.name_en}")
                     else:
                         # name_en yoksa name_tr'yi çevir
                         raw_name = item.name_tr if hasattr(item, 'name_tr') else str(item)
                         
                         # Ham fiş metni karakterlerini temizle
-                        if any(char in raw_name for char in ['*', 'x', '#', '408', '443', 'x3,45', 'x2,00', 'x1,15']):
-                            # Basit normalizasyon
-                            normalized_name = raw_name
-                            # Sayıları ve özel karakterleri temizle
-                            import re
-                            normalized_name = re.sub(r'[xX]\d+[,.]?\d*', '', normalized_name)  # x3,45 gibi
-                            normalized_name = re.sub(r'\d+[,.]?\d*', '', normalized_name)  # Sayılar
-                            normalized_name = re.sub(r'[*#]', '', normalized_name)  # Özel karakterler
-                            normalized_name = re.sub(r'\s+', ' ', normalized_name).strip()  # Fazla boşluklar
+                        if _RECEIPT_MARKER_RE.search(raw_name):
+                            # Basit normalizasyon: sayıları ve özel karakterleri temizle
+                            normalized_name = _RECEIPT_NOISE_RE.sub('', _RECEIPT_QTY_RE.sub('', raw_name))
+                            normalized_name = _MULTI_SPACE_RE.sub(' ', normalized_name).strip()
                             
                             # Çok kısa veya anlamsız isimleri atla
                             if len(normalized_name) < 3 or normalized_name in ['', ' ', 'ii', 'pi', 'a', 'e']:
                                 continue
                                 
-                            # İngilizceye çevir
-                            from translate_utils import translate_text
-                            translated_name = translate_text(normalized_name)
-                            if translated_name and len(translated_name) > 2:
-                                ingredients.append(translated_name)
-                                logger.info(f"✅ Temizlendi: '{raw_name}' -> '{translated_name}'")
-                            else:
-                                logger.warning(f"❌ Çevrilemedi: '{normalized_name}'")
+                            names.append((raw_name, normalized_name, True))
                         else:
                             # Temiz isimse direkt çevir
-                            from translate_utils import translate_text
-                            translated_name = translate_text(raw_name)
-                            if translated_name and len(translated_name) > 2:
-                                ingredients.append(translated_name)
-                                logger.info(f"✅ Temiz isim: '{raw_name}' -> '{translated_name}'")
+                            names.append((raw_name, raw_name, False))
                                 
                 except Exception as e:
                     logger.warning(f"❌ İşleme hatası: {e}")
                     continue
             
+            # Tüm adlar tek toplu istekle çevrilir
+            try:
+                translated = translate_utils.translate_batch(name for _, name, _ in names if name)
+            except Exception as e:
+                logger.warning(f"Çeviri hatası: {e}")
+                translated = {}
+            
+            ingredients = []
+            for raw_name, name, cleaned in names:
+                if name is None:
+                    ingredients.append(raw_name)
+                    continue
+                translated_name = translated.get(name, name)
+                if translated_name and len(translated_name) > 2:
+                    ingredients.append(translated_name)
+                    if cleaned:
+                        logger.info(f"✅ Temizlendi: '{raw_name}' -> '{translated_name}'")
+                    else:
+                        logger.info(f"✅ Temiz isim: '{raw_name}' -> '{translated_name}'")
+                elif cleaned:
+                    logger.warning(f"❌ Çevrilemedi: '{name}'")
+            
             logger.info(f"📦 Envanter malzemeleri: {ingredients}")
             
             # Spoonacular API'den tarif ara
@@ -846,100 +1052,80 @@ class RecipeRecommender:
                 return []
             
             # Detaylı bilgileri al
-            detailed_recipes = self._get_detailed_recipes([r['id'] for r in recipes])
+            detailed_recipes = self._get_detailed_recipes(recipes)
             
-            # Tarifleri önceliklendir
-            recommendations = []
+            # Tarifleri önceliklendir (çevrilecek metinler toplanır, çeviri tek toplu istekle yapılır)
+            scored = []
+            to_translate = set()
+            match_cache = {}
             for recipe in detailed_recipes:
-                priority_score, urgency = self.calculate_recipe_priority(recipe, inventory)
+                priority_score, urgency = self.calculate_recipe_priority(recipe, inventory, match_cache)
                 
                 if priority_score >= 0:  # Tüm tarifleri al
                     used_products = [ing.get('name', '') for ing in recipe.get('usedIngredients', [])]
                     missing_products = [ing.get('name', '') for ing in recipe.get('missedIngredients', [])]
                     
-                    # Türkçe çevirileri yap
-                    try:
-                        title_tr = translate_utils.translate_text(recipe.get('title', ''))
-                        used_products_tr = [translate_utils.translate_text(product) for product in used_products[:3]]
-                        missing_products_tr = [translate_utils.translate_text(product) for product in missing_products]
-                    except Exception as e:
-                        logger.warning(f"Çeviri hatası: {e}")
-                        title_tr = recipe.get('title', '')
-                        used_products_tr = used_products[:3]
-                        missing_products_tr = missing_products
-                    
-                    recommendations.append(RecipeRecommendation(
-                        recipe_id=recipe.get('id', 0),
-                        title=recipe.get('title', ''),
-                        title_tr=title_tr,
-                        used_products=used_products[:3],
-                        used_products_tr=used_products_tr,
-                        missing_products=missing_products,
-                        missing_products_tr=missing_products_tr,
-                        priority_score=priority_score,
-                        shelf_life_urgency=urgency,
-                        ready_in_minutes=recipe.get('readyInMinutes', 0),
-                        servings=recipe.get('servings', 0),
-                        source_url=recipe.get('sourceUrl', '') or f"https://spoonacular.com/recipes/{recipe.get('id', '')}" or "https://spoonacular.com/",
-                        instructions=recipe.get('instructions', ''),
-                        summary=recipe.get('summary', '')
-                    ))
+                    to_translate.add(recipe.get('title', ''))
+                    to_translate.update(used_products[:3])
+                    to_translate.update(missing_products)
+                    scored.append((recipe, priority_score, urgency, used_products, missing_products))
             
-            # Öncelik skoruna göre sırala
-            recommendations.sort(key=lambda x: x.priority_score, reverse=True)
+            # Türkçe çevirileri yap
+            try:
+                tr = translate_utils.translate_batch(to_translate)
+            except Exception as e:
+                logger.warning(f"Çeviri hatası: {e}")
+                tr = {}
+            
+            recommendations = []
+            for recipe, priority_score, urgency, used_products, missing_products in scored:
+                recommendations.append(RecipeRecommendation(
+                    recipe_id=recipe.get('id', 0),
+                    title=recipe.get('title', ''),
+                    title_tr=tr.get(recipe.get('title', ''), recipe.get('title', '')),
+                    image=recipe.get('image', ''),
+                    used_products=used_products[:3],
+                    used_products_tr=[tr.get(product, product) for product in used_products[:3]],
+                    missing_products=missing_products,
+                    missing_products_tr=[tr.get(product, product) for product in missing_products],
+                    priority_score=priority_score,
+                    shelf_life_urgency=urgency,
+                    ready_in_minutes=recipe.get('readyInMinutes', 0),
+                    servings=recipe.get('servings', 0),
+                    source_url=recipe.get('sourceUrl', '') or f"https://spoonacular.com/recipes/{recipe.get('id', '')}" or "https://spoonacular.com/",
+                    instructions=recipe.get('instructions', ''),
+                    summary=recipe.get('summary', '')
+                ))
             
             logger.info(f"✅ {len(recommendations)} envanter tarifi hazırlandı")
-            return recommendations[:max_recipes]
+            # Öncelik skoruna göre ilk max_recipes (tam sıralama yerine kısmi yığın seçimi)
+            return heapq.nlargest(max_recipes, recommendations, key=lambda x: x.priority_score)
             
         except Exception as e:
             logger.error(f"❌ Envanterden tarif önerisi hatası: {e}")
             return []
     
-    def _get_user_inventory(self, user_id: int) -> List[ProductWithShelfLife]:
-        """Kullanıcının envanterini veritabanından al"""
+    def _get_user_inventory(self, user_id: int, limit: Optional[int] = None) -> List[ProductWithShelfLife]:
+        """Kullanıcının envanterini veritabanından al (limit: SKT'si en yakın ilk N ürün, None = tümü)"""
         try:
             engine = get_engine()
             with engine.connect() as conn:
-                # PostgreSQL için sorgu
-                result = conn.execute(text("""
-                    SELECT id, product_name, product_name_en, category_id, 
-                           purchase_date, expiry_date, shelf_life_days
-                    FROM user_inventory 
-                    WHERE user_id = :user_id AND expiry_date > NOW()
-                    ORDER BY expiry_date ASC
-                """), {"user_id": user_id})
-                
-                inventory_items = result.fetchall()
-                inventory_products = []
+                # PostgreSQL için sorgu (kalan gün ve öncelik skoru SQL'de)
+                result = conn.execute(_USER_INVENTORY_SQL, {"user_id": user_id, "limit": limit})
                 
-                for item in inventory_items:
-                    # Raf ömrü hesapla
-                    expiry_date = item.expiry_date
-                    days_remaining = (expiry_date - datetime.now()).days
-                    
-                    # Öncelik skoru hesapla (raf ömrüne göre)
-                    if days_remaining <= 3:
-                        priority_score = 90  # Çok acil
-                    elif days_remaining <= 7:
-                        priority_score = 70  # Acil
-                    elif days_remaining <= 14:
-                        priority_score = 50  # Orta
-                    else:
-                        priority_score = 30  # Normal
-                    
-                    # Ürün adını belirle (İngilizce varsa onu kullan)
-                    name_en = item.product_name_en if hasattr(item, 'product_name_en') and item.product_name_en else item.product_name
-                    name_tr = item.product_name if hasattr(item, 'product_name') else str(item)
-                    
-                    inventory_products.append(ProductWithShelfLife(
+                # Ürün adını belirle (İngilizce varsa onu kullan)
+                inventory_products = [
+                    ProductWithShelfLife(
                         product_id=item.id,
-                        name_en=name_en,
-                        name_tr=name_tr,
-                        days_remaining=days_remaining,
+                        name_en=item.product_name_en or item.product_name,
+                        name_tr=item.product_name,
+                        days_remaining=item.days_remaining,
                         storage_type="pantry",
                         open_state="sealed",
-                        priority_score=priority_score
-                    ))
+                        priority_score=item.priority_score
+                    )
+                    for item in result
+                ]
                 
                 logger.info(f"📦 Kullanıcı {user_id} envanteri: {len(inventory_products)} ürün")
                 return inventory_products
@@ -948,75 +1134,6 @@ class RecipeRecommender:
             logger.error(f"❌ Envanter alma hatası: {e}")
             # Hata durumunda boş liste döndür
             return []
-        """Kullanıcının envanterinden tarif öner"""
-        logger.info(f"👤 Kullanıcı {user_id} için envanterden tarif önerisi")
-        
-        try:
-            # Kullanıcının envanterini al
-            inventory_products = self._get_user_inventory(user_id)
-            
-            if not inventory_products:
-                logger.warning("❌ Kullanıcının envanteri boş!")
-                return []
-            
-            # Envanter ürünlerini ingredient listesine dönüştür (zaten normalize edilmiş)
-            ingredients = []
-            for product in inventory_products[:10]:
-                if product.name_en and len(product.name_en.strip()) > 0:
-                    ingredients.append(product.name_en)
-                else:
-                    # name_tr'yi İngilizceye çevir
-                    try:
-                        from translate_utils import translate_text
-                        translated_name = translate_text(product.name_tr)
-                        if translated_name:
-                            ingredients.append(translated_name)
-                        else:
-                            ingredients.append(product.name_tr)
-                    except Exception as e:
-                        logger.warning(f"Çeviri hatası {product.name_tr}: {e}")
-                        ingredients.append(product.name_tr)
-            
-            logger.info(f"📦 Envanterden {len(ingredients)} ürün alındı: {ingredients[:5]}")
-            
-            # Tarifleri ara
-            recipes = self.search_recipes_by_ingredients(ingredients, max_recipes * 2, user_id)
-            
-            if not recipes:
-                logger.warning("❌ Tarif bulunamadı!")
-                return []
-            
-            # Detaylı bilgileri al
-            detailed_recipes = self._get_detailed_recipes(recipes)
-            
-            # Önceliklendirme yap
-            recommendations = []
-            for recipe_data in detailed_recipes:
-                recommendation = RecipeRecommendation(
-                    recipe_id=recipe_data['id'],
-                    title=recipe_data['title'],
-                    title_tr=recipe_data['title'],
-                    image=recipe_data.get('image', ''),
-                    ready_in_minutes=recipe_data.get('readyInMinutes', 0),
-                    servings=recipe_data.get('servings', 1),
-                    source_url=recipe_data.get('sourceUrl', ''),
-                    used_products=recipe_data.get('usedIngredients', []),
-                    used_products_tr=recipe_data.get('usedIngredients', []),
-                    missing_products=recipe_data.get('missedIngredients', []),
-                    missing_products_tr=recipe_data.get('missedIngredients', []),
-                    priority_score=75.0,  # Varsayılan skor
-                    shelf_life_urgency="DÜŞÜK",
-                    instructions=recipe_data.get('instructions', ''),
-                    summary=recipe_data.get('summary', '')
-                )
-                recommendations.append(recommendation)
-            
-            logger.info(f"✅ {len(recommendations)} tarif önerisi hazırlandı")
-            return recommendations[:max_recipes]
-            
-        except Exception as e:
-            logger.error(f"❌ Envanterden tarif önerisi hatası: {e}")
-            return []
     
     def display_recommendations(self, recommendations: List[RecipeRecommendation]):
         """Önerileri göster"""
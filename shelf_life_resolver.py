@@ -1,19 +1,53 @@
 # shelf_life_resolver.py  (DB-ONLY)
 # -*- coding: utf-8 -*-
 import logging
+import time
 from datetime import datetime, timezone
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
 from sqlalchemy import select
 from sqlalchemy.engine import Connection
 
-from db import shelf_life_rules  # tablo şemanıza göre
+from db import get_engine, shelf_life_rules  # tablo şemanıza göre
 # from db import storage  # API kullanmıyorsanız şart değil
 
 logger = logging.getLogger(__name__)
 
 OPEN_STATE_DEFAULT = "sealed"   # sealed|opened|cooked
 
+# shelf_life_rules küçük ve neredeyse statik: tamamı bellekte, TTL ile yenilenir
+_RULES_TTL_S = 600
+
+# (storage_id, open_state, product_id | category_id) -> days
+_RuleIndex = Dict[Tuple[Optional[int], str, int], int]
+
+
+@lru_cache(maxsize=1)
+def _rules_index(_ttl_bucket: int) -> Tuple[_RuleIndex, _RuleIndex]:
+    by_product: _RuleIndex = {}
+    by_category: _RuleIndex = {}
+    stmt = select(
+        shelf_life_rules.c.product_id,
+        shelf_life_rules.c.category_id,
+        shelf_life_rules.c.storage_id,
+        shelf_life_rules.c.open_state,
+        shelf_life_rules.c.days,
+    ).where(shelf_life_rules.c.days.is_not(None))
+    with get_engine().connect() as conn:
+        for r in conn.execute(stmt):
+            if r.product_id is not None:
+                by_product.setdefault((r.storage_id, r.open_state, r.product_id), int(r.days))
+            if r.category_id is not None:
+                by_category.setdefault((r.storage_id, r.open_state, r.category_id), int(r.days))
+    return by_product, by_category
+
+
+def _rules() -> Tuple[_RuleIndex, _RuleIndex]:
+    # Zaman dilimi değişince lru_cache(maxsize=1) eski indeksi atar ve tabloyu yeniden okur
+    return _rules_index(int(time.monotonic() // _RULES_TTL_S))
+
+
 class ShelfLifeResolver:
     """
     Sadece DB cache: ürün/kategori + storage + open_state -> days
@@ -33,22 +67,18 @@ class ShelfLifeResolver:
         storage_id: int,
         open_state: str
     ) -> Optional[int]:
-        base = (
-            select(shelf_life_rules.c.days)
-            .where(shelf_life_rules.c.storage_id == storage_id)
-            .where(shelf_life_rules.c.open_state == open_state)
-        )
+        # Kurallar bellekteki indeksten okunur; conn imza uyumluluğu için duruyor
+        by_product, by_category = _rules()
+
         # Önce ürün-kuralı (daha spesifik)
         if product_id is not None:
-            row = conn.execute(base.where(shelf_life_rules.c.product_id == product_id).limit(1)).first()
-            if row and row[0] is not None:
-                return int(row[0])
+            days = by_product.get((storage_id, open_state, product_id))
+            if days is not None:
+                return days
 
         # Sonra kategori fallback
         if category_id is not None:
-            row = conn.execute(base.where(shelf_life_rules.c.category_id == category_id).limit(1)).first()
-            if row and row[0] is not None:
-                return int(row[0])
+            return by_category.get((storage_id, open_state, category_id))
 
         return None
 
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""RecipeRecommender.recommend_recipes için ağ/DB'siz testler"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SPOONACULAR_API_KEY", "test-key")
+
+import recipe_recommender  # noqa: E402
+from recipe_recommender import ProductWithShelfLife, RecipeRecommender  # noqa: E402
+
+
+class RecommendRecipesTest(unittest.TestCase):
+    def setUp(self):
+        self.recommender = RecipeRecommender.__new__(RecipeRecommender)
+        self.inventory = [
+            ProductWithShelfLife(
+                product_id=1, name_en="milk", name_tr="süt", days_remaining=2,
+                storage_type="fridge", open_state="sealed", priority_score=90,
+            ),
+        ]
+        self.search_results = [
+            {
+                "id": 42,
+                "title": "Milk Pudding",
+                "usedIngredients": [{"name": "milk"}],
+                "missedIngredients": [{"name": "sugar"}],
+            },
+        ]
+
+    def test_returns_recommendations_with_details(self):
+        details = {42: {"id": 42, "readyInMinutes": 20, "servings": 2,
+                        "sourceUrl": "https://example.com/pudding",
+                        "instructions": "Kaynat.", "summary": "", "cuisines": [], "dishTypes": []}}
+        with mock.patch.object(self.recommender, "_get_user_inventory", return_value=self.inventory), \
+                mock.patch.object(self.recommender, "search_recipes_by_ingredients",
+                                  return_value=self.search_results), \
+                mock.patch.object(self.recommender, "get_recipe_details_bulk",
+                                  return_value=details) as bulk, \
+                mock.patch.object(recipe_recommender.translate_utils, "translate_batch",
+                                  side_effect=lambda texts, **kw: {t: t for t in texts}):
+            recommendations = self.recommender.recommend_recipes(user_id=1, max_recipes=5)
+
+        bulk.assert_called_once_with([42])
+        self.assertEqual(len(recommendations), 1)
+        rec = recommendations[0]
+        self.assertEqual(rec.recipe_id, 42)
+        self.assertEqual(rec.used_products, ["milk"])
+        self.assertEqual(rec.ready_in_minutes, 20)
+        self.assertEqual(rec.source_url, "https://example.com/pudding")
+        self.assertGreater(rec.priority_score, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,21 +2,122 @@
 import os
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from functools import lru_cache
+from typing import Dict, Iterable, List
 from dotenv import load_dotenv
+from sqlalchemy import inspect, text as sql_text
+
+from db import get_engine
 
 # .env dosyasını yükle
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 GOOGLE_TRANSLATE_API_KEY = os.getenv("GOOGLE_TRANSLATE_API_KEY") or None
+_TRANSLATE_URL = "https://translation.googleapis.com/language/translate/v2"
+# Google v2 tek istekte en fazla 128 "q" kabul eder
+_BATCH_MAX_Q = 128
+
+
+def _build_http_session() -> requests.Session:
+    """translation.googleapis.com için bağlantı havuzlu oturum (TCP/TLS her çağrıda yeniden kurulmaz)"""
+    session = requests.Session()
+    # Çeviri isteği POST ama yan etkisiz: 429/5xx'te geri çekilerek tekrar denenir.
+    # Son yanıt çağırana döner; raise_for_status + except yalnızca son çare
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({"POST"}), raise_on_status=False)
+    session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry))
+    return session
+
+
+_HTTP_SESSION = _build_http_session()
+
+# Başarılı çeviriler (metin, kaynak, hedef) anahtarıyla tutulur; hata durumunda dönen
+# girdi metni önbelleğe alınmaz ki geçici bir hata kalıcı hale gelmesin
+_CACHE_MAX = 50000
+_cache: Dict[tuple, str] = {}
+
+# Kalıcı katman: süreç yeniden başlasa da aynı metin için ücretli API çağrısı tekrarlanmaz
+_STORED_SQL = sql_text("""
+    SELECT source_text, text
+    FROM text_translations
+    WHERE source_text = ANY(:texts) AND source_lang = :source_lang AND target_lang = :target_lang
+""")
+_STORE_SQL = sql_text("""
+    INSERT INTO text_translations (source_text, source_lang, target_lang, text)
+    VALUES (:source_text, :source_lang, :target_lang, :text)
+    ON CONFLICT (source_text, source_lang, target_lang) DO NOTHING
+""")
+
+
+def _remember(key: tuple, translated: str) -> None:
+    if len(_cache) >= _CACHE_MAX:
+        _cache.clear()
+    _cache[key] = translated
+
+
+@lru_cache(maxsize=1)
+def _store_available() -> bool:
+    """Kalıcı katman yalnızca PostgreSQL'de ve tablo varsa (init_db oluşturur) kullanılır"""
+    try:
+        engine = get_engine()
+        available = engine.dialect.name == "postgresql" and inspect(engine).has_table("text_translations")
+    except Exception as e:
+        logger.warning(f"text_translations kontrol edilemedi: {e}")
+        return False
+    if not available:
+        logger.info("text_translations yok: çeviriler yalnızca bellekte tutulacak")
+    return available
+
+
+def _load_stored(texts: List[str], source_lang: str, target_lang: str) -> Dict[str, str]:
+    """text_translations tablosundaki çeviriler; bulunanlar bellek önbelleğine de alınır"""
+    if not _store_available():
+        return {}
+    try:
+        with get_engine().connect() as conn:
+            rows = conn.execute(_STORED_SQL, {"texts": texts, "source_lang": source_lang,
+                                              "target_lang": target_lang}).all()
+    except Exception as e:
+        logger.warning(f"Kayıtlı çeviriler okunamadı: {e}")
+        return {}
+    stored = {}
+    for row in rows:
+        stored[row.source_text] = row.text
+        _remember((row.source_text, source_lang, target_lang), row.text)
+    return stored
+
+
+def _store(pairs: Dict[str, str], source_lang: str, target_lang: str) -> None:
+    """Yeni çevirileri tek executemany ile sakla; hata çeviriyi engellemez"""
+    if not pairs or not _store_available():
+        return
+    rows = [{"source_text": source, "source_lang": source_lang, "target_lang": target_lang, "text": translated}
+            for source, translated in pairs.items()]
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(_STORE_SQL, rows)
+    except Exception as e:
+        logger.warning(f"Çeviriler kaydedilemedi: {e}")
+
 
 def translate_text(text: str, source_lang: str = "en", target_lang: str = "tr") -> str:
     """Sadece Google Translate API kullanır"""
-    if not text or not GOOGLE_TRANSLATE_API_KEY:
-        logger.warning(f"Missing text or API key: text='{text}', key={GOOGLE_TRANSLATE_API_KEY[:20] if GOOGLE_TRANSLATE_API_KEY else None}")
+    if not text:
+        return text
+    if GOOGLE_TRANSLATE_API_KEY is None:
+        # Sık çağrılan yol: mesaj yalnızca DEBUG açıkken biçimlenir
+        logger.debug("Missing API key, text returned as is: %r", text)
         return text
+    key = (text, source_lang, target_lang)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    # Tekil yol DB'ye gitmez (çağıranın açık işlemi içinde ek SELECT/INSERT olmasın);
+    # kalıcı katman yalnızca translate_batch'te
     try:
-        url = "https://translation.googleapis.com/language/translate/v2"
         params = {
             "q": text,
             "source": source_lang,
@@ -24,12 +125,67 @@ def translate_text(text: str, source_lang: str = "en", target_lang: str = "tr")
             "format": "text",
             "key": GOOGLE_TRANSLATE_API_KEY,
         }
-        r = requests.post(url, data=params, timeout=6)
+        r = _HTTP_SESSION.post(_TRANSLATE_URL, data=params, timeout=6)
         r.raise_for_status()
         data = r.json()
         translated = data["data"]["translations"][0]["translatedText"]
         logger.info(f"Translation successful: '{text}' -> '{translated}'")
+        _remember(key, translated)
         return translated
     except Exception as e:
         logger.warning(f"Translate fail '{text}': {e}")
         return text  # fallback
+
+
+def translate_batch(texts: Iterable[str], source_lang: str = "en", target_lang: str = "tr") -> Dict[str, str]:
+    """
+    Birden çok metni tek istekte çevirir (tekrarlar bir kez gönderilir).
+    Önce bellek, sonra text_translations tablosu; yalnızca ikisinde de
+    olmayanlar API'ye gider. {metin: çeviri} döner; çevrilemeyen metin
+    kendisiyle eşlenir.
+    """
+    result: Dict[str, str] = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        cached = _cache.get((text, source_lang, target_lang)) if text else None
+        if cached is not None:
+            result[text] = cached
+        else:
+            result[text] = text  # fallback
+            if text:
+                pending.append(text)
+
+    if pending:
+        stored = _load_stored(pending, source_lang, target_lang)
+        if stored:
+            result.update(stored)
+            pending = [text for text in pending if text not in stored]
+
+    if not pending or not GOOGLE_TRANSLATE_API_KEY:
+        if pending:
+            logger.warning(f"Missing API key: {len(pending)} metin çevrilmedi")
+        return result
+
+    fresh: Dict[str, str] = {}
+    for start in range(0, len(pending), _BATCH_MAX_Q):
+        chunk = pending[start:start + _BATCH_MAX_Q]
+        try:
+            params = [("q", text) for text in chunk] + [
+                ("source", source_lang),
+                ("target", target_lang),
+                ("format", "text"),
+                ("key", GOOGLE_TRANSLATE_API_KEY),
+            ]
+            r = _HTTP_SESSION.post(_TRANSLATE_URL, data=params, timeout=6)
+            r.raise_for_status()
+            translations = r.json()["data"]["translations"]
+            for text, item in zip(chunk, translations):
+                translated = item["translatedText"]
+                result[text] = translated
+                fresh[text] = translated
+                _remember((text, source_lang, target_lang), translated)
+            logger.info(f"Batch translation successful: {len(chunk)} metin")
+        except Exception as e:
+            logger.warning(f"Batch translate fail ({len(chunk)} metin): {e}")
+    _store(fresh, source_lang, target_lang)
+    return result